@@ -11,6 +11,17 @@ except NameError:
 log = logging.getLogger(__name__)
 
 
+def play(player, canonicalBoard, lastAction):
+    """
+    Returns the action of player on canonicalBoard. Players with a true
+    takesLastAction attribute, such as MCTS.MCTSPlayer, are also given the
+    move that led to canonicalBoard (None at the start of a game).
+    """
+    if getattr(player, 'takesLastAction', False):
+        return player(canonicalBoard, lastAction)
+    return player(canonicalBoard)
+
+
 class Arena():
     """
     An Arena class where any 2 agents can be pit against each other.
@@ -47,13 +58,15 @@ class Arena():
         curPlayer = 1
         board = self.game.getInitBoard()
         it = 0
-        while self.game.getGameEnded(board, curPlayer) == 0:
+        action = None
+        result = self.game.getGameEnded(board, curPlayer)
+        while result == 0:
             it += 1
             if verbose:
                 assert self.display
                 print("Turn ", str(it), "Player ", str(curPlayer))
                 self.display(board)
-            action = players[curPlayer + 1](self.game.getCanonicalForm(board, curPlayer))
+            action = play(players[curPlayer + 1], self.game.getCanonicalForm(board, curPlayer), action)
 
             valids = self.game.getValidMoves(self.game.getCanonicalForm(board, curPlayer), 1)
 
@@ -62,16 +75,23 @@ class Arena():
                 log.debug(f'valids = {valids}')
                 assert valids[action] > 0
             board, curPlayer = self.game.getNextState(board, curPlayer, action)
+            result = self.game.getGameEndedAfterMove(board, curPlayer, action)
         if verbose:
             assert self.display
             print("Game over: Turn ", str(it), "Result ", str(self.game.getGameEnded(board, 1)))
             self.display(board)
-        return curPlayer * self.game.getGameEnded(board, curPlayer)
+        return curPlayer * result
 
-    def playGames(self, num, verbose=False):
+    def playGames(self, num, verbose=False, stop=None):
         """
         Plays num games in which player1 starts num/2 games and player2 starts
-        num/2 games.
+        num/2 games. The games are played in pairs, player1 starts the first
+        game of every pair and player2 the second.
+
+        Input:
+            stop: optional function of (oneWon, twoWon, draws) that ends the
+                  match early when it returns True, e.g. an SPRT. It is called
+                  after every pair of games.
 
         Returns:
             oneWon: games won by player1
@@ -83,7 +103,7 @@ class Arena():
         oneWon = 0
         twoWon = 0
         draws = 0
-        for _ in tqdm(range(num), desc="Arena.playGames (1)"):
+        for _ in tqdm(range(num), desc="Arena.playGames"):
             gameResult = self.playGame(verbose=verbose)
             if gameResult == 1:
                 oneWon += 1
@@ -92,10 +112,9 @@ class Arena():
             else:
                 draws += 1
 
-        self.player1, self.player2 = self.player2, self.player1
-
-        for _ in tqdm(range(num), desc="Arena.playGames (2)"):
+            self.player1, self.player2 = self.player2, self.player1
             gameResult = self.playGame(verbose=verbose)
+            self.player1, self.player2 = self.player2, self.player1
             if gameResult == -1:
                 oneWon += 1
             elif gameResult == 1:
@@ -103,4 +122,7 @@ class Arena():
             else:
                 draws += 1
 
+            if stop is not None and stop(oneWon, twoWon, draws):
+                break
+
         return oneWon, twoWon, draws
@@ -1,10 +1,14 @@
 import logging
 from utils import dotdict
 from gomaku.pytorch.NNet import NNetWrapper as NNet
-from MCTS import MCTS
+from Arena import play
+from MCTS import MCTS, MCTSPlayer
+from InferenceServer import InferenceServer
+from Profiler import Profiler, writeSummary
+from TranspositionTable import TranspositionTable
 import numpy as np
 import concurrent.futures as conc
-from time import sleep
+from time import sleep, time
 from gomaku.GomakuGame import GomakuGame
 import os
 
@@ -24,7 +28,7 @@ class Arena():
     An Arena class where any 2 agents can be pit against each other.
     """
 
-    def __init__(self, player1_checkpoint, player2_checkpoint, num_agents, game, net_1_args=None, net_2_args=None, args=None, display=None, names=None):
+    def __init__(self, player1_checkpoint, player2_checkpoint, num_agents, game, net_1_args=None, net_2_args=None, args=None, display=None, names=None, shared_net=False, profile_file=None):
         """
         Input:
             player 1,2: two functions that takes board as input, return action
@@ -32,6 +36,12 @@ class Arena():
             display: a function that takes board as input and prints it (e.g.
                      display in othello/OthelloGame). Is necessary for verbose
                      mode.
+            shared_net: if True, a checkpoint is loaded only once and all agents
+                        playing it share the network through an InferenceServer
+                        that batches their predictions.
+            profile_file: the summary of every playGamesParallel call is
+                          logged and, if this is given, appended to this file
+                          as a JSON line.
 
         see othello/OthelloPlayers.py for an example. See pit.py for pitting
         human players/other baselines with each other.
@@ -43,24 +53,51 @@ class Arena():
         self.display = display
         self.args = args or dotdict({'numMCTSSims': 50, 'cpuct': 1.0})
         self.names = names or ("Player_1", "Player_2")
+        self.servers = []
+        self.profilers = []  # one per agent, each agent searches in its own thread
+        self.profile_file = profile_file
 
         # If player1 or player2 are checkpoints, load them. Otherwise the same agent will play for each.
         if isinstance(self.player1, str):
-            self.player1s = [self.load_agent(self.player1, net_1_args) for _ in range(self.num_agents)]
+            self.player1s = self.load_agents(self.player1, net_1_args, shared_net)
         else:
             self.player1s = [self.player1 for _ in range(self.num_agents)]
         if isinstance(self.player2, str):
-            self.player2s = [self.load_agent(self.player2, net_2_args) for _ in range(self.num_agents)]
+            self.player2s = self.load_agents(self.player2, net_2_args, shared_net)
         else:
             self.player2s = [self.player2 for _ in range(self.num_agents)]
         self.to_play = 0
         self.left_to_play = 0
 
-    def load_agent(self, checkpoint, args):
-        net = NNet(self.game, net_args=args)
+    def load_agents(self, checkpoint, args, shared_net):
+        # all agents of a checkpoint share the evaluations of their trees if args.transpositionTableSize > 0
+        table_size = self.args.get('transpositionTableSize', 0)
+        table = TranspositionTable(table_size) if table_size > 0 else None
+        if not shared_net:
+            return [self.load_agent(checkpoint, args, table) for _ in range(self.num_agents)]
+        net = self.load_net(checkpoint, args)
+        server = InferenceServer(net, maxBatchSize=self.num_agents)
+        self.servers.append(server)
+        return [self.make_agent(server, table) for _ in range(self.num_agents)]
+
+    def load_agent(self, checkpoint, args, table=None):
+        return self.make_agent(self.load_net(checkpoint, args), table)
+
+    def load_net(self, checkpoint, args):
+        # .onnx checkpoints are evaluated with onnxruntime, see gomaku/onnxrt/NNet.py
+        if checkpoint.endswith('.onnx'):
+            from gomaku.onnxrt.NNet import NNetWrapper as OnnxNNet
+            net = OnnxNNet(self.game, net_args=args)
+        else:
+            net = NNet(self.game, net_args=args)
         net.load_checkpoint(filename=checkpoint)
-        mcts = MCTS(self.game, net, self.args)
-        return lambda board: np.argmax(mcts.getActionProb(board, temp=0))
+        return net
+
+    def make_agent(self, net, table=None):
+        profiler = Profiler()
+        self.profilers.append(profiler)
+        mcts = MCTS(self.game, net, self.args, table, profiler)
+        return MCTSPlayer(mcts)
 
     def playGame(self, agent_index, verbose=False, reverse=False, save_index=-1):
         """
@@ -103,13 +140,15 @@ class Arena():
         curPlayer = 1
         board = self.game.getInitBoard()
         it = 0
-        while self.game.getGameEnded(board, curPlayer) == 0:
+        action = None
+        result = self.game.getGameEnded(board, curPlayer)
+        while result == 0:
             it += 1
             if verbose:
                 assert self.display
                 print("Turn ", str(it), "Player ", str(curPlayer))
                 self.display(board)
-            action = players[curPlayer + 1](self.game.getCanonicalForm(board, curPlayer))
+            action = play(players[curPlayer + 1], self.game.getCanonicalForm(board, curPlayer), action)
 
             valids = self.game.getValidMoves(self.game.getCanonicalForm(board, curPlayer), 1)
 
@@ -118,12 +157,13 @@ class Arena():
                 log.debug(f'valids = {valids}')
                 assert valids[action] > 0
             board, curPlayer = self.game.getNextState(board, curPlayer, action)
+            result = self.game.getGameEndedAfterMove(board, curPlayer, action)
             log_move(curPlayer, action, board)
         if verbose:
             assert self.display
             print("Game over: Turn ", str(it), "Result ", str(self.game.getGameEnded(board, 1)))
             self.display(board)
-        winner = (-1 if reverse else 1) * curPlayer * self.game.getGameEnded(board, curPlayer)
+        winner = (-1 if reverse else 1) * curPlayer * result
         try:
             file.close()
             if abs(winner) < 1:
@@ -138,28 +178,41 @@ class Arena():
     def handle_agent(self, agent_index, results, log=False):
         """
         Plays games with agents[agent_index] storing winner in results until self.to_play == 0
+        Player 2 starts every even numbered game, so the colours stay balanced
+        when the match is stopped early.
         :param agent_index:
         :param results:
         :return:
         """
         while self.left_to_play > 0:
             self.left_to_play -= 1  # TODO: Figure out if this is a race condition. Since this is threading and not multiprocessesing I don't see why it would be.
-            reverse = self.left_to_play < self.to_play/2
-            results.append(self.playGame(agent_index, save_index=self.to_play-self.left_to_play if log else -1, reverse=reverse))
+            game_index = self.to_play - self.left_to_play
+            reverse = game_index % 2 == 0
+            results.append(self.playGame(agent_index, save_index=game_index if log else -1, reverse=reverse))
             self.played += 1
 
-    def playGamesParallel(self, num, verbose=False, log=False):
+    def playGamesParallel(self, num, verbose=False, log=False, stop=None):
         """
         Plays num games with a thread for each agent.
         :param num:
         :param agent_index:
         :param verbose:
+        :param stop: optional function of (player 1 wins, player 2 wins, draws)
+                     that ends the match early when it returns True, e.g. an
+                     SPRT. No new games are started then, the games being
+                     played are finished and counted.
         :return:
         """
         self.to_play = num
         self.left_to_play = num
         self.played = 0
         results = []
+        start = time()
+        for profiler in self.profilers:
+            profiler.reset()
+        for server in self.servers:
+            server.resetStats()
+            server.start()
         with conc.ThreadPoolExecutor(max_workers=self.num_agents) as executor:
             executor.map(lambda p: self.handle_agent(*p), [(i, results, log) for i in range(self.num_agents)])
             with tqdm(total=self.to_play, desc="Arena Games (Parallelized)") as pbar:
@@ -175,16 +228,38 @@ class Arena():
                         pbar.n = self.played
                         pbar.refresh()
                         last = self.played
+                        if stop is not None and stop(player_1_won, player_2_won, draws):
+                            self.left_to_play = 0
+                            break
                     sleep(0.1)
-                pbar.n = self.to_play
+                pbar.n = self.played
                 pbar.refresh()
+        for server in self.servers:
+            server.stop()
         results = np.array(results)
         player_1_won = np.count_nonzero(results == 1)
         player_2_won = np.count_nonzero(results == -1)
-        draws = self.to_play - player_1_won - player_2_won
+        draws = len(results) - player_1_won - player_2_won
         self.to_play = 0
+        writeSummary(self.profile_file, self.summary(player_1_won, player_2_won, draws, time() - start))
         return player_1_won, player_2_won, draws
 
+    def summary(self, player_1_won, player_2_won, draws, seconds):
+        """
+        Returns the results of a playGamesParallel call with the statistics of
+        the searches of all agents.
+        """
+        profiler = Profiler()
+        for agent_profiler in self.profilers:
+            profiler.merge(agent_profiler)
+        for server in self.servers:
+            profiler.count('serverBatches', server.numBatches)
+            profiler.count('serverBoards', server.numBoards)
+        games = int(player_1_won + player_2_won + draws)
+        return {'players': list(self.names), 'results': [int(player_1_won), int(player_2_won), int(draws)],
+                'games': games, 'seconds': round(seconds, 3), 'gamesPerHour': round(3600 * games / max(seconds, 1e-9), 1),
+                'mcts': profiler.summary()}
+
 if __name__ == "__main__":
     game = GomakuGame(8)
     arena = Arena("/Users/aidandempster/Desktop/EngSci/ESC190/alphaZero/checkpoints/best.pth.tar", "/Users/aidandempster/Desktop/EngSci/ESC190/alphaZero/checkpoints/checkpoint_20.pth.tar", 2, game)
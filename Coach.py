@@ -1,9 +1,14 @@
 import logging
+import multiprocessing as mp
 import os
+import queue
+import random
 import sys
+import threading
+import time
 from collections import deque
-from pickle import Pickler, Unpickler
-from random import shuffle
+from itertools import cycle
+from pickle import Unpickler
 
 import numpy as np
 try:
@@ -15,7 +20,13 @@ except NameError:
     from tqdm import tqdm
 
 from Arena import Arena
-from MCTS import MCTS
+from ExampleStore import ExampleStore
+from InferenceServer import InferenceServer
+from MCTS import MCTS, MCTSPlayer
+from Profiler import Profiler, writeSummary
+from SPRT import SPRT
+from TranspositionTable import TranspositionTable
+from utils import dotdict
 
 log = logging.getLogger(__name__)
 
@@ -31,15 +42,38 @@ class Coach():
         self.nnet = nnet
         self.pnet = self.nnet.__class__(self.game, self.nnet.net_args)  # the competitor network
         self.args = args
-        self.mcts = MCTS(self.game, self.nnet, self.args)
-        self.trainExamplesHistory = []  # history of examples from args.numItersForTrainExamplesHistory latest iterations
+        self.table = self.makeTable()  # network evaluations shared by the self-play trees, see makeTable
+        self.profiler = Profiler()  # counters and timers of the self-play trees, summarized every iteration
+        self.mcts = MCTS(self.game, self.nnet, self.args, self.table, self.profiler)
+        self.lazySymmetries = self.useLazySymmetries()
+        # history of examples from args.numItersForTrainExamplesHistory latest iterations, one shard per iteration
+        self.store = ExampleStore(os.path.join(self.args.checkpoint, 'examples'))
         self.skipFirstSelfPlay = False  # can be overriden in loadTrainExamples()
         if "newModelCallback" in args:
             self.newModelCallback = args["newModelCallback"]
         else:
             self.newModelCallback = lambda checkpoint: print(f"New Best at iteration: {checkpoint}")
 
-    def executeEpisode(self):
+    def useLazySymmetries(self):
+        """
+        Returns True if examples are stored once, in canonical form, and the
+        network applies a random symmetry to them when it trains. This needs
+        args.lazySymmetries (default True) and a game that implements
+        getSymmetryPermutations.
+        """
+        return self.args.get('lazySymmetries', True) and self.game.getSymmetryPermutations() is not None
+
+    def getQueueLength(self):
+        """
+        Returns the number of examples an iteration keeps. args.maxlenOfQueue
+        counts every symmetric form of a position, so with lazy symmetries,
+        which store a position once, it is divided by the number of symmetries.
+        """
+        if self.lazySymmetries:
+            return max(1, self.args.maxlenOfQueue // len(self.game.getSymmetryPermutations()))
+        return self.args.maxlenOfQueue
+
+    def executeEpisode(self, mcts=None):
         """
         This function executes one episode of self-play, starting with player 1.
         As the game is played, each turn is added as a training example to
@@ -50,33 +84,169 @@ class Coach():
         It uses a temp=1 if episodeStep < tempThreshold, and thereafter
         uses temp=0.
 
+        Input:
+            mcts: the search tree to play with, defaults to self.mcts
+
         Returns:
             trainExamples: a list of examples of the form (canonicalBoard, currPlayer, pi,v)
                            pi is the MCTS informed policy vector, v is +1 if
                            the player eventually won the game, else -1.
         """
+        mcts = mcts or self.mcts
         trainExamples = []
         board = self.game.getInitBoard()
-        self.curPlayer = 1
+        curPlayer = 1
         episodeStep = 0
+        action = None
 
         while True:
             episodeStep += 1
-            canonicalBoard = self.game.getCanonicalForm(board, self.curPlayer)
+            canonicalBoard = self.game.getCanonicalForm(board, curPlayer)
             temp = int(episodeStep < self.args.tempThreshold)
 
-            pi = self.mcts.getActionProb(canonicalBoard, temp=temp)
-            sym = self.game.getSymmetries(canonicalBoard, pi)
-            for b, p in sym:
-                trainExamples.append([b, self.curPlayer, p, None])
+            pi = mcts.getActionProb(canonicalBoard, temp=temp, lastAction=action)
+            # the network is trained on the feature planes if the game provides them
+            planes = self.game.getFeaturePlanes(canonicalBoard, action)
+            example = canonicalBoard if planes is None else planes
+            if self.lazySymmetries:
+                # the network applies the symmetries to the training batches
+                trainExamples.append([example, curPlayer, pi, None])
+            else:
+                sym = self.game.getSymmetries(example, pi)
+                for b, p in sym:
+                    trainExamples.append([b, curPlayer, p, None])
 
             action = np.random.choice(len(pi), p=pi)
-            board, self.curPlayer = self.game.getNextState(board, self.curPlayer, action)
+            if self.args.get('reuseTree', False):
+                mcts.advance(action)
+            board, curPlayer = self.game.getNextState(board, curPlayer, action)
 
-            r = self.game.getGameEnded(board, self.curPlayer)
+            r = self.game.getGameEndedAfterMove(board, curPlayer, action)
 
             if r != 0:
-                return [(x[0], x[2], r * ((-1) ** (x[1] != self.curPlayer))) for x in trainExamples], r * self.curPlayer
+                return [(x[0], x[2], r * ((-1) ** (x[1] != curPlayer))) for x in trainExamples], r * curPlayer
+
+    def playEpisodes(self, iteration=0):
+        """
+        Generates the results of self-play episodes, one executeEpisode result
+        at a time, until the caller stops iterating.
+
+        With args.numSelfPlayWorkers > 1 the episodes are played by a pool of
+        worker processes, see playEpisodesInProcesses.
+
+        With args.numSelfPlayThreads > 1 the episodes are played concurrently
+        by that many threads whose trees share one InferenceServer, so the
+        network evaluates the boards of all games in batches.
+        """
+        if self.args.get('numSelfPlayWorkers', 1) > 1:
+            yield from self.playEpisodesInProcesses(iteration)
+            return
+
+        numThreads = self.args.get('numSelfPlayThreads', 1)
+        if numThreads <= 1:
+            while True:
+                self.mcts = MCTS(self.game, self.nnet, self.args, self.table, self.profiler)  # reset search tree
+                yield self.executeEpisode()
+
+        server = InferenceServer(self.nnet, maxBatchSize=self.args.get('inferenceBatchSize', numThreads),
+                                 maxWaitTime=self.args.get('inferenceMaxWait', 0.001))
+        results = queue.Queue()
+        stop = threading.Event()
+        profilers = [Profiler() for _ in range(numThreads)]
+
+        def worker(profiler):
+            try:
+                while not stop.is_set():
+                    results.put(self.executeEpisode(MCTS(self.game, server, self.args, self.table, profiler)))
+            except Exception as e:
+                results.put(e)
+
+        threads = [threading.Thread(target=worker, args=(profiler,), daemon=True) for profiler in profilers]
+        with server:
+            for thread in threads:
+                thread.start()
+            try:
+                while True:
+                    result = results.get()
+                    if isinstance(result, Exception):
+                        raise result
+                    yield result
+            finally:
+                # games that are still running are finished and discarded
+                stop.set()
+                for thread in threads:
+                    thread.join()
+                for profiler in profilers:
+                    self.profiler.merge(profiler)
+                self.profiler.count('serverBatches', server.numBatches)
+                self.profiler.count('serverBoards', server.numBoards)
+
+    def playEpisodesInProcesses(self, iteration):
+        """
+        Plays self-play episodes in args.numSelfPlayWorkers processes. Every
+        worker loads the current weights, seeds its random generators with
+        args.seed, the iteration and its index, and streams the results of its
+        episodes back through a queue.
+
+        The results are yielded round-robin over the workers (the first episode
+        of every worker, then the second one, ...) so that a run only depends
+        on the seeds and not on which process happens to finish first.
+        """
+        numWorkers = self.args['numSelfPlayWorkers']
+        self.nnet.save_checkpoint(folder=self.args.checkpoint, filename='selfplay.pth.tar')
+        workerArgs = dotdict({k: v for k, v in self.args.items() if not callable(v)})
+        baseSeed = self.args.get('seed', 0) + 1000 * iteration
+
+        context = mp.get_context('spawn')
+        results = context.Queue()
+        stop = context.Event()
+        workers = [context.Process(target=selfPlayWorker, daemon=True,
+                                   args=(workerId, baseSeed + workerId, self.game, self.nnet.__class__,
+                                         self.nnet.net_args, workerArgs, results, stop))
+                   for workerId in range(numWorkers)]
+        for worker in workers:
+            worker.start()
+
+        pending = [deque() for _ in range(numWorkers)]
+        try:
+            for workerId in cycle(range(numWorkers)):
+                while not pending[workerId]:
+                    try:
+                        sender, result, profile = getResult(results, workers, timeout=1)
+                    except queue.Empty:
+                        continue
+                    if isinstance(result, Exception):
+                        raise result
+                    self.profiler.merge(profile)
+                    pending[sender].append(result)
+                yield pending[workerId].popleft()
+        finally:
+            stop.set()
+            drainWorkers(results, workers)
+
+    def makeTable(self):
+        """
+        Returns a TranspositionTable of args.transpositionTableSize entries, or
+        None if the size is 0. Entries are tied to the version of the weights
+        that produced them, so a table stays valid across episodes and is
+        invalidated by training or by loading other weights.
+        """
+        size = self.args.get('transpositionTableSize', 0)
+        return TranspositionTable(size) if size > 0 else None
+
+    def makeSPRT(self):
+        """
+        Returns the SPRT that ends the arena early once it is settled whether
+        the new network scores above args.updateThreshold, or None if
+        args.arenaSPRT is off. Scores within args.sprtMargin of the threshold
+        may go either way; args.sprtAlpha and args.sprtBeta bound the
+        probabilities of accepting a network that scores threshold - margin
+        and of rejecting one that scores threshold + margin.
+        """
+        if not self.args.get('arenaSPRT', False):
+            return None
+        return SPRT.around(self.args.updateThreshold, self.args.get('sprtMargin', 0.1),
+                           self.args.get('sprtAlpha', 0.05), self.args.get('sprtBeta', 0.05))
 
     def printExamples(self, examples):
         num_examples = len(examples)
@@ -91,14 +261,24 @@ class Coach():
         examples in trainExamples (which has a maximum length of maxlenofQueue).
         It then pits the new neural network against the old one and accepts it
         only if it wins >= updateThreshold fraction of games.
+
+        With args.pipelined the phases run concurrently instead, see
+        learnPipelined.
         """
+        if self.args.get('pipelined', False):
+            return self.learnPipelined()
+        if not self.skipFirstSelfPlay and self.store.iterations():
+            log.warning(f'Discarding the examples of a previous run in {self.store.folder}')
+            self.store.trim(0)
         startIter = self.getMaxTrainExamplesIndex() + 2
         for i in range(startIter, self.args.numIters + 1):
             # bookkeeping
             log.info(f'Starting Iter #{i} ...')
+            summary = {'iteration': i}
             # examples of the iteration
             if not self.skipFirstSelfPlay or i > 1:
-                iterationTrainExamples = deque([], maxlen=self.args.maxlenOfQueue)
+                start = time.time()
+                iterationTrainExamples = deque([], maxlen=self.getQueueLength())
 
                 # for _ in tqdm(range(self.args.numEps), desc="Self Play"):
                 #     self.mcts = MCTS(self.game, self.nnet, self.args)  # reset search tree
@@ -113,9 +293,9 @@ class Coach():
                 white_wins = 0
                 draws = 0
                 pbar = tqdm(range(self.args.numEps), desc=f"Self Play - White: {white_wins}, Black: {black_wins}, Draw: {draws}")
+                episodes = self.playEpisodes(i)
                 while num_complete < self.args.numEps:
-                    self.mcts = MCTS(self.game, self.nnet, self.args)
-                    newExamples, winner = self.executeEpisode()
+                    newExamples, winner = next(episodes)
                     if abs(winner) > 0.9:
                         iterationTrainExamples += newExamples
                         num_complete += 1
@@ -126,85 +306,449 @@ class Coach():
                         draws += 1
                     pbar.set_description_str(f"Self Play - White: {white_wins}, Black: {black_wins}, Draw: {draws}")
                     pbar.update(0)
+                episodes.close()
+                if self.table is not None:
+                    log.info(f'Transposition table hit rate: {self.table.hitRate():.1%} ({len(self.table)} entries)')
+                    self.table.resetStats()
+                summary['selfPlay'] = self.summarizeSelfPlay(num_complete, draws, len(iterationTrainExamples),
+                                                             time.time() - start)
 
+                # save the iteration examples to the history
+                # NB! the examples were collected using the model from the previous iteration, so (i-1)
+                self.saveTrainExamples(i - 1, iterationTrainExamples)
 
-                # save the iteration examples to the history 
-                self.trainExamplesHistory.append((i-1, iterationTrainExamples))
+            # the oldest iterations expire from the history
+            self.store.trim(self.args.numItersForTrainExamplesHistory)
 
-            while len(self.trainExamplesHistory) > self.args.numItersForTrainExamplesHistory:
-                log.warning(
-                    f"Removing the oldest entry in trainExamples. len(trainExamplesHistory) = {len(self.trainExamplesHistory)}")
-                self.trainExamplesHistory.pop(0)
-            # backup history to a file
-            # NB! the examples were collected using the model from the previous iteration, so (i-1)  
-            self.saveTrainExamples(i - 1)
-
-            # shuffle examples before training
-            trainExamples = []
-            for e in self.trainExamplesHistory:
-                if isinstance(e[0], int):
-                    trainExamples.extend(e[1])
-                else:
-                    trainExamples.extend(e)
-            shuffle(trainExamples)
+            # the examples are sampled at random during training, no need to shuffle them
+            trainExamples = self.store.load()
 
             # training new network, keeping a copy of the old one
             self.nnet.save_checkpoint(folder=self.args.checkpoint, filename='temp.pth.tar')
             self.pnet.load_checkpoint(folder=self.args.checkpoint, filename='temp.pth.tar')
-            pmcts = MCTS(self.game, self.pnet, self.args)
+            # pnet has the weights self-play was played with, so it can reuse their evaluations
+            arenaProfiler = Profiler()
+            pmcts = MCTS(self.game, self.pnet, self.args, self.table, arenaProfiler)
 
-            self.nnet.train(trainExamples)
-            nmcts = MCTS(self.game, self.nnet, self.args)
+            start = time.time()
+            self.nnet.train(trainExamples, augment=self.lazySymmetries)
+            summary['train'] = {'examples': len(trainExamples), 'seconds': round(time.time() - start, 3)}
+            nmcts = MCTS(self.game, self.nnet, self.args, self.makeTable(), arenaProfiler)
 
             log.info('PITTING AGAINST PREVIOUS VERSION')
-            arena = Arena(lambda x: np.argmax(pmcts.getActionProb(x, temp=0)),
-                          lambda x: np.argmax(nmcts.getActionProb(x, temp=0)), self.game)
-            pwins, nwins, draws = arena.playGames(self.args.arenaCompare)
-
-            log.info('NEW/PREV WINS : %d / %d ; DRAWS : %d' % (nwins, pwins, draws))
-            if pwins + nwins == 0 or float(nwins) / (pwins + nwins) < self.args.updateThreshold:
+            start = time.time()
+            accept, stats = self.pit(pmcts, nmcts)
+            summary['arena'] = {'games': sum(stats), 'seconds': round(time.time() - start, 3),
+                                'mcts': arenaProfiler.summary()}
+            summary['accepted'] = accept
+            writeSummary(self.getProfileFile(), summary)
+            if not accept:
                 log.info('REJECTING NEW MODEL')
                 self.nnet.load_checkpoint(folder=self.args.checkpoint, filename='temp.pth.tar')
             else:
                 log.info('ACCEPTING NEW MODEL')
                 self.nnet.save_checkpoint(folder=self.args.checkpoint, filename=self.getCheckpointFile(i))
                 self.nnet.save_checkpoint(folder=self.args.checkpoint, filename='best.pth.tar')
+                if self.args.get('exportModel', False):
+                    self.nnet.export_checkpoint(folder=self.args.checkpoint, filename='best.pth.tar',
+                                                quantize=self.args.get('exportQuantize', False))
                 self.newModelCallback(i)
 
+    def pit(self, pmcts, nmcts):
+        """
+        Plays the arena between the previous network (pmcts) and the new one
+        (nmcts), stopped early if args.arenaSPRT is on, see makeSPRT.
+
+        Returns:
+            accept: True if the new network is accepted
+            (pwins, nwins, draws): the results of the arena
+        """
+        arena = Arena(MCTSPlayer(pmcts), MCTSPlayer(nmcts), self.game)
+        sprt = self.makeSPRT()
+        stop = None if sprt is None else lambda pwins, nwins, draws: sprt.test(nwins, pwins) != 0
+        pwins, nwins, draws = arena.playGames(self.args.arenaCompare, stop=stop)
+
+        log.info('NEW/PREV WINS : %d / %d ; DRAWS : %d' % (nwins, pwins, draws))
+        # the SPRT decides if it is settled, the threshold if the arena ran out of games first
+        decision = 0 if sprt is None else sprt.test(nwins, pwins)
+        if sprt is not None:
+            log.info(f'SPRT: {"accept" if decision > 0 else "reject" if decision < 0 else "undecided"} '
+                     f'after {pwins + nwins + draws} games, '
+                     f'{self.args.arenaCompare - (pwins + nwins + draws)} games saved')
+        if decision != 0:
+            accept = decision > 0
+        else:
+            accept = pwins + nwins > 0 and float(nwins) / (pwins + nwins) >= self.args.updateThreshold
+        return accept, (pwins, nwins, draws)
+
+    def learnPipelined(self):
+        """
+        Runs self-play, training and the arena of learn() concurrently instead
+        of one after the other:
+
+        - max(1, args.numSelfPlayWorkers) processes play self-play episodes
+          with the latest accepted weights and switch to new weights as soon
+          as they are accepted
+        - a thread of this process collects the episodes and adds every
+          args.numEps games as a new shard to the store
+        - this process trains nnet whenever a shard was added and saves the
+          weights as candidate_<n>.pth.tar
+        - an evaluator process pits the newest candidate against the accepted
+          weights, candidates that are superseded before their turn are skipped
+
+        Accepted weights are saved as checkpoint_<n>.pth.tar and best.pth.tar
+        and announced by writing n to best.version, checkpoint_0.pth.tar holds
+        the starting weights. The trainer keeps training its own weights
+        whether its candidates are accepted or not. Stops after args.numIters
+        candidates, with nnet holding the last accepted weights.
+        """
+        folder = self.args.checkpoint
+        if not self.skipFirstSelfPlay and self.store.iterations():
+            log.warning(f'Discarding the examples of a previous run in {self.store.folder}')
+            self.store.trim(0)
+        self.nnet.save_checkpoint(folder=folder, filename=self.getCheckpointFile(0))
+        writeBestVersion(folder, 0)
+
+        workerArgs = dotdict({k: v for k, v in self.args.items() if not callable(v)})
+        context = mp.get_context('spawn')
+        results = context.Queue()  # (workerId, version, executeEpisode result) from the self-play workers
+        candidates = context.Queue()  # candidate numbers for the evaluator, None stops it
+        decisions = context.Queue()  # (candidate, accepted, arena results) from the evaluator
+        stop = context.Event()
+        workers = [context.Process(target=pipelineSelfPlayWorker, daemon=True,
+                                   args=(workerId, self.args.get('seed', 0) + workerId, self.game,
+                                         self.nnet.__class__, self.nnet.net_args, workerArgs, results, stop))
+                   for workerId in range(max(1, self.args.get('numSelfPlayWorkers', 1)))]
+        evaluator = context.Process(target=pipelineEvaluator, daemon=True,
+                                    args=(self.game, self.nnet.__class__, self.nnet.net_args, workerArgs,
+                                          candidates, decisions))
+
+        # the store is read by the trainer while the collector adds and trims shards
+        lock = threading.Lock()
+        shardAdded = threading.Event()
+        errors = []
+        if self.store.iterations():
+            shardAdded.set()  # train on the loaded examples right away
+
+        def collect():
+            shard = self.store.iterations()[-1] + 1 if self.store.iterations() else 0
+            examples, games, draws, versions, start = [], 0, 0, set(), time.time()
+            try:
+                while not stop.is_set():
+                    try:
+                        _, version, result, profile = getResult(results, workers, timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    if isinstance(result, Exception):
+                        raise result
+                    self.profiler.merge(profile)
+                    newExamples, winner = result
+                    if abs(winner) > 0.9:
+                        examples += newExamples
+                        games += 1
+                        versions.add(version)
+                    else:
+                        draws += 1
+                    if games >= self.args.numEps:
+                        with lock:
+                            self.saveTrainExamples(shard, examples)
+                            self.store.trim(self.args.numItersForTrainExamplesHistory)
+                        log.info(f'Shard {shard}: {games} games of checkpoints {sorted(versions)}')
+                        writeSummary(self.getProfileFile(), {
+                            'shard': shard, 'checkpoints': sorted(versions),
+                            'selfPlay': self.summarizeSelfPlay(games, draws, len(examples), time.time() - start)})
+                        shard += 1
+                        examples, games, draws, versions, start = [], 0, 0, set(), time.time()
+                        shardAdded.set()
+            except Exception as e:
+                errors.append(e)
+                shardAdded.set()
+
+        def handleDecisions(block=False):
+            while True:
+                try:
+                    candidate, accepted, stats, arena = decisions.get(timeout=1 if block else 0)
+                except queue.Empty:
+                    return None
+                if isinstance(accepted, Exception):
+                    raise accepted
+                pwins, nwins, draws = stats
+                log.info(f'Candidate {candidate}: NEW/PREV WINS : {nwins} / {pwins} ; DRAWS : {draws}, '
+                         f'{"ACCEPTED" if accepted else "REJECTED"}')
+                writeSummary(self.getProfileFile(), {'candidate': candidate, 'arena': arena, 'accepted': accepted})
+                if accepted:
+                    self.newModelCallback(candidate)
+                if block:
+                    return candidate
+
+        collector = threading.Thread(target=collect, daemon=True)
+        for process in workers + [evaluator]:
+            process.start()
+        collector.start()
+        try:
+            for candidate in range(1, self.args.numIters + 1):
+                while not shardAdded.wait(0.1):
+                    handleDecisions()
+                    if not evaluator.is_alive():
+                        raise RuntimeError(f'The evaluator exited with code {evaluator.exitcode}')
+                if errors:
+                    raise errors[0]
+                shardAdded.clear()
+                log.info(f'Training candidate {candidate} ...')
+                with lock:
+                    trainExamples = self.store.load()
+                start = time.time()
+                self.nnet.train(trainExamples, augment=self.lazySymmetries)
+                writeSummary(self.getProfileFile(), {'candidate': candidate, 'train': {
+                    'examples': len(trainExamples), 'seconds': round(time.time() - start, 3)}})
+                self.nnet.save_checkpoint(folder=folder, filename=f'candidate_{candidate}.pth.tar')
+                candidates.put(candidate)
+                handleDecisions()
+            candidates.put(None)
+            while evaluator.is_alive() or not decisions.empty():
+                handleDecisions(block=True)
+        finally:
+            stop.set()
+            candidates.put(None)
+            collector.join()
+            drainWorkers(results, workers)
+            evaluator.join()
+        self.nnet.load_checkpoint(folder=folder, filename=self.getCheckpointFile(readBestVersion(folder)))
+
+    def summarizeSelfPlay(self, games, draws, examples, seconds):
+        """
+        Returns the self-play part of the summary of an iteration, with the
+        search statistics collected by self.profiler, and resets the profiler.
+        """
+        summary = {'games': games, 'draws': draws, 'examples': examples, 'seconds': round(seconds, 3),
+                   'gamesPerHour': round(3600 * (games + draws) / max(seconds, 1e-9), 1),
+                   'examplesPerHour': round(3600 * examples / max(seconds, 1e-9), 1),
+                   'mcts': self.profiler.summary()}
+        self.profiler.reset()
+        return summary
+
+    def getProfileFile(self):
+        """
+        Returns the file the summaries of the iterations are appended to as
+        JSON lines.
+        """
+        return os.path.join(self.args.checkpoint, 'profile.jsonl')
+
     def getCheckpointFile(self, iteration):
         return 'checkpoint_' + str(iteration) + '.pth.tar'
 
-    def saveTrainExamples(self, iteration):
-        folder = self.args.checkpoint
-        if not os.path.exists(folder):
-            os.makedirs(folder)
-        filename = os.path.join(folder, self.getCheckpointFile(iteration) + ".examples")
-        latest = os.path.join(folder, "best.pth.tar.examples")
-        with open(filename, "wb+") as f:
-            Pickler(f).dump(self.trainExamplesHistory)
-        with open(latest, "wb+") as f:
-            Pickler(f).dump(self.trainExamplesHistory)
+    def saveTrainExamples(self, iteration, examples):
+        """
+        Writes the examples of an iteration as a new shard of the store. The
+        shards of earlier iterations are left untouched.
+        """
+        # without lazy symmetries executeEpisode stores every symmetric form
+        self.store.addIteration(iteration, examples, canonical=self.lazySymmetries)
 
     def loadTrainExamples(self):
+        """
+        Adopts the examples stored next to args.load_folder_file: the shards of
+        its examples folder, or the pickled history of older runs
+        (<model file>.examples), which is converted into shards.
+        """
+        source = ExampleStore(os.path.join(self.args.load_folder_file[0], 'examples'))
         modelFile = os.path.join(self.args.load_folder_file[0], self.args.load_folder_file[1])
         examplesFile = modelFile + ".examples"
-        if not os.path.isfile(examplesFile):
-            log.warning(f'File "{examplesFile}" with trainExamples not found!')
+        if source.iterations():
+            log.info(f"Examples found in {source.folder}.")
+            if os.path.abspath(source.folder) != os.path.abspath(self.store.folder):
+                log.info("Copying them...")
+                self.store.trim(0)
+                examples = source.load()
+                for iteration, shard, canonical in zip(source.iterations(), examples.shards, examples.canonical):
+                    self.store.addIteration(iteration, shard, canonical)
+        elif os.path.isfile(examplesFile):
+            log.info("File with trainExamples found. Converting it...")
+            with open(examplesFile, "rb") as f:
+                history = Unpickler(f).load()
+            self.store.trim(0)
+            for iteration, entry in enumerate(history):
+                if isinstance(entry[0], int):
+                    iteration, entry = entry
+                # older runs stored every symmetric form of a position
+                self.store.addIteration(iteration, entry, canonical=False)
+        else:
+            log.warning(f'No examples found in "{source.folder}" or "{examplesFile}"!')
             r = input("Continue? [y|n]")
             if r != "y":
                 sys.exit()
-        else:
-            log.info("File with trainExamples found. Loading it...")
-            with open(examplesFile, "rb") as f:
-                self.trainExamplesHistory = Unpickler(f).load()
-            log.info('Loading done!')
+            return
+        log.info('Loading done!')
 
-            # examples based on the model were already collected (loaded)
-            self.skipFirstSelfPlay = True
+        # examples based on the model were already collected (loaded)
+        self.skipFirstSelfPlay = True
 
     def getMaxTrainExamplesIndex(self):
-        if len(self.trainExamplesHistory) < 1:
+        iterations = self.store.iterations()
+        if not self.skipFirstSelfPlay or len(iterations) < 1:
             return -1
-        if isinstance(self.trainExamplesHistory[-1][0], int):
-            return self.trainExamplesHistory[-1][0]
-        return -1
+        return iterations[-1]
+
+
+class SelfPlayWorker(Coach):
+    """
+    The part of Coach that a worker process needs: it plays episodes and
+    arenas but does not keep a competitor network.
+    """
+
+    def __init__(self, game, nnet, args):
+        self.game = game
+        self.nnet = nnet
+        self.args = args
+        self.profiler = Profiler()
+        self.lazySymmetries = self.useLazySymmetries()
+
+
+def selfPlayWorker(workerId, seed, game, nnetClass, netArgs, args, results, stop):
+    """
+    Entry point of a process started by Coach.playEpisodesInProcesses. Plays
+    episodes with the weights saved in args.checkpoint/selfplay.pth.tar and
+    puts (workerId, result, profile) on results until stop is set, profile
+    being the Profiler.snapshot of the episode.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    try:
+        nnet = nnetClass(game, netArgs)
+        nnet.load_checkpoint(folder=args.checkpoint, filename='selfplay.pth.tar')
+        worker = SelfPlayWorker(game, nnet, args)
+        table = worker.makeTable()
+        while not stop.is_set():
+            result = worker.executeEpisode(MCTS(game, nnet, args, table, worker.profiler))
+            results.put((workerId, result, worker.profiler.pop()))
+    except Exception as e:
+        results.put((workerId, e, None))
+
+
+def getResult(results, workers, timeout):
+    """
+    Returns the next item of the queue results that the worker processes
+    fill. Raises queue.Empty if none arrived within timeout seconds, and a
+    RuntimeError if a worker had already exited without one, e.g. killed by
+    the OS, instead of waiting for it forever.
+    """
+    # whatever a worker put before it exited arrives within the timeout
+    dead = [worker for worker in workers if not worker.is_alive()]
+    try:
+        return results.get(timeout=timeout)
+    except queue.Empty:
+        if dead:
+            raise RuntimeError(f'Self-play worker {dead[0].name} exited with code {dead[0].exitcode} (workers are '
+                               f'spawned, a script that starts Coach without an if __name__ == "__main__" guard '
+                               f'makes them fail at startup)') from None
+        raise
+
+
+def drainWorkers(results, workers):
+    """
+    Waits for the worker processes to exit once they were told to stop. They
+    finish the episode they are playing first, and a process does not exit
+    while the items it put on the queue results are not read, so the queue is
+    drained meanwhile.
+    """
+    while any(worker.is_alive() for worker in workers):
+        try:
+            results.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    for worker in workers:
+        worker.join()
+
+
+def readBestVersion(folder):
+    """
+    Returns the number of the latest accepted checkpoint of Coach.learnPipelined.
+    """
+    with open(os.path.join(folder, 'best.version')) as f:
+        return int(f.read())
+
+
+def writeBestVersion(folder, version):
+    # the file is replaced at once so that readers never see it half written
+    path = os.path.join(folder, 'best.version')
+    with open(path + '.tmp', 'w') as f:
+        f.write(str(version))
+    os.replace(path + '.tmp', path)
+
+
+def pipelineSelfPlayWorker(workerId, seed, game, nnetClass, netArgs, args, results, stop):
+    """
+    Entry point of the self-play processes of Coach.learnPipelined. Before
+    every episode it switches to the latest accepted checkpoint if there is a
+    new one, and puts (workerId, version, result, profile) on results until
+    stop is set, profile being the Profiler.snapshot of the episode.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    try:
+        nnet = nnetClass(game, netArgs)
+        worker = SelfPlayWorker(game, nnet, args)
+        table = worker.makeTable()
+        version = None
+        while not stop.is_set():
+            latest = readBestVersion(args.checkpoint)
+            if latest != version:
+                nnet.load_checkpoint(folder=args.checkpoint, filename=worker.getCheckpointFile(latest))
+                version = latest
+            result = worker.executeEpisode(MCTS(game, nnet, args, table, worker.profiler))
+            results.put((workerId, version, result, worker.profiler.pop()))
+    except Exception as e:
+        results.put((workerId, None, e, None))
+
+
+def pipelineEvaluator(game, nnetClass, netArgs, args, candidates, decisions):
+    """
+    Entry point of the evaluator process of Coach.learnPipelined. Pits the
+    newest candidate on the candidates queue against the latest accepted
+    checkpoint, publishes it if it is accepted and puts
+    (candidate, accepted, (pwins, nwins, draws), arena profile) on decisions.
+    Stops at None.
+    """
+    folder = args.checkpoint
+    try:
+        nnet = nnetClass(game, netArgs)
+        pnet = nnetClass(game, netArgs)
+        worker = SelfPlayWorker(game, nnet, args)
+        done = False
+        while not done:
+            candidate = candidates.get()
+            if candidate is None:
+                break
+            # candidates that were superseded while the previous arena was played are skipped
+            while True:
+                try:
+                    newer = candidates.get_nowait()
+                except queue.Empty:
+                    break
+                if newer is None:
+                    done = True
+                    break
+                os.remove(os.path.join(folder, f'candidate_{candidate}.pth.tar'))
+                candidate = newer
+            candidateFile = f'candidate_{candidate}.pth.tar'
+            pnet.load_checkpoint(folder=folder, filename=worker.getCheckpointFile(readBestVersion(folder)))
+            nnet.load_checkpoint(folder=folder, filename=candidateFile)
+            start = time.time()
+            accepted, stats = worker.pit(MCTS(game, pnet, args, worker.makeTable(), worker.profiler),
+                                         MCTS(game, nnet, args, worker.makeTable(), worker.profiler))
+            arena = {'games': sum(stats), 'seconds': round(time.time() - start, 3),
+                     'mcts': worker.profiler.summary()}
+            worker.profiler.reset()
+            if accepted:
+                os.replace(os.path.join(folder, candidateFile),
+                           os.path.join(folder, worker.getCheckpointFile(candidate)))
+                nnet.save_checkpoint(folder=folder, filename='best.pth.tar')
+                if args.get('exportModel', False):
+                    nnet.export_checkpoint(folder=folder, filename='best.pth.tar',
+                                           quantize=args.get('exportQuantize', False))
+                writeBestVersion(folder, candidate)
+            else:
+                os.remove(os.path.join(folder, candidateFile))
+            decisions.put((candidate, accepted, stats, arena))
+    except Exception as e:
+        decisions.put((None, e, None, None))
@@ -0,0 +1,183 @@
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class ExampleStore():
+    """
+    On-disk replay buffer for the training examples of Coach.
+
+    Every iteration is written once as its own shard, a folder holding the
+    boards (int8), policies and values of its examples as .npy arrays. Shards
+    are never rewritten: the oldest ones are deleted once they fall out of the
+    history window. load() opens the shards with np.memmap, so training can
+    sample batches without reading all examples into memory.
+
+    A shard also records in shard.json whether it is canonical, i.e. holds
+    every position once (Coach with lazySymmetries), or holds all symmetric
+    forms of its positions, like the pickled histories of older runs.
+    """
+
+    def __init__(self, folder, policyDtype=np.float32):
+        self.folder = folder
+        self.policyDtype = policyDtype
+
+    def getShardFolder(self, iteration):
+        return os.path.join(self.folder, f'iteration_{iteration}')
+
+    def iterations(self):
+        """
+        Returns:
+            iterations: the iterations that have a shard, oldest first
+        """
+        if not os.path.isdir(self.folder):
+            return []
+        return sorted(int(name.split('_')[1]) for name in os.listdir(self.folder)
+                      if name.startswith('iteration_') and not name.endswith('.tmp'))
+
+    def addIteration(self, iteration, examples, canonical=True):
+        """
+        Writes the shard of an iteration.
+
+        Input:
+            iteration: the iteration the examples were collected in
+            examples: an iterable of (board, pi, v) tuples, or a
+                      (boards, pis, vs) tuple of stacked arrays
+            canonical: whether the examples hold every position once, so that
+                       training applies the symmetries to them, or already
+                       hold all the symmetric forms
+        """
+        if isinstance(examples, tuple) and len(examples) == 3 and isinstance(examples[0], np.ndarray):
+            boards, pis, vs = examples
+        else:
+            boards, pis, vs = zip(*examples)
+        folder = self.getShardFolder(iteration)
+        tmp = folder + '.tmp'
+        os.makedirs(tmp, exist_ok=True)
+        np.save(os.path.join(tmp, 'boards.npy'), np.asarray(boards, dtype=np.int8))
+        np.save(os.path.join(tmp, 'pis.npy'), np.asarray(pis, dtype=self.policyDtype))
+        np.save(os.path.join(tmp, 'vs.npy'), np.asarray(vs, dtype=np.float32))
+        with open(os.path.join(tmp, 'shard.json'), 'w') as f:
+            json.dump({'canonical': bool(canonical)}, f)
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+        os.replace(tmp, folder)
+
+    def trim(self, numIterations):
+        """
+        Deletes the oldest shards so that at most numIterations remain.
+        """
+        iterations = self.iterations()
+        for iteration in iterations[:max(0, len(iterations) - numIterations)]:
+            log.warning(f"Removing the examples of iteration {iteration} from {self.folder}")
+            shutil.rmtree(self.getShardFolder(iteration))
+
+    def load(self):
+        """
+        Returns:
+            examples: ShardedExamples over all shards of the store
+        """
+        shards = []
+        canonical = []
+        for iteration in self.iterations():
+            folder = self.getShardFolder(iteration)
+            shards.append(tuple(np.load(os.path.join(folder, f'{name}.npy'), mmap_mode='r')
+                                for name in ('boards', 'pis', 'vs')))
+            canonical.append(self.isCanonical(folder))
+        return ShardedExamples(shards, canonical)
+
+    def isCanonical(self, folder):
+        """
+        Returns whether the shard in folder holds every position once. Shards
+        written before shard.json existed were canonical.
+        """
+        path = os.path.join(folder, 'shard.json')
+        if not os.path.exists(path):
+            return True
+        with open(path) as f:
+            return json.load(f).get('canonical', True)
+
+
+class ShardedExamples():
+    """
+    Read-only view over the memory-mapped shards of an ExampleStore. It can be
+    indexed like the list of (board, pi, v) examples it replaces, and sample()
+    gathers a whole batch at once.
+
+    An example of a canonical shard stands for all the symmetric forms of its
+    position, see countForms and sampleIds.
+    """
+
+    def __init__(self, shards, canonical=None):
+        self.shards = shards
+        self.offsets = np.cumsum([0] + [len(vs) for _, _, vs in shards])
+        self.canonical = np.ones(len(shards), dtype=bool) if canonical is None else np.asarray(canonical, dtype=bool)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, i):
+        shard = np.searchsorted(self.offsets, i, side='right') - 1
+        boards, pis, vs = self.shards[shard]
+        i -= self.offsets[shard]
+        return boards[i], pis[i], vs[i]
+
+    def countForms(self, numForms):
+        """
+        Returns:
+            count: the number of examples when every example of a canonical
+                   shard counts as numForms symmetric forms
+        """
+        lengths = np.diff(self.offsets)
+        return int(np.sum(np.where(self.canonical, numForms * lengths, lengths)))
+
+    def sampleIds(self, size, numForms=1):
+        """
+        Returns:
+            ids: size random example indices, an example of a canonical shard
+                 being numForms times as likely as one of a shard that holds
+                 all symmetric forms, so that every position is as likely as
+                 if all its forms were stored
+        """
+        if numForms == 1 or self.canonical.all() or not self.canonical.any():
+            return np.random.randint(len(self), size=size)
+        # indices into the shards with every example of a canonical shard repeated numForms times
+        weights = np.where(self.canonical, numForms, 1)
+        formOffsets = np.cumsum(np.concatenate(([0], weights * np.diff(self.offsets))))
+        forms = np.random.randint(formOffsets[-1], size=size)
+        shardIds = np.searchsorted(formOffsets, forms, side='right') - 1
+        return self.offsets[shardIds] + (forms - formOffsets[shardIds]) // weights[shardIds]
+
+    def isCanonical(self, ids):
+        """
+        Returns:
+            mask: whether each of the examples ids comes from a canonical shard
+        """
+        return self.canonical[np.searchsorted(self.offsets, ids, side='right') - 1]
+
+    def sample(self, ids):
+        """
+        Input:
+            ids: np array of example indices
+
+        Returns:
+            (boards, pis, vs): the examples as stacked arrays, in the order of ids
+        """
+        shardIds = np.searchsorted(self.offsets, ids, side='right') - 1
+        boards, pis, vs = self.shards[0]
+        outBoards = np.empty((len(ids), *boards.shape[1:]), dtype=boards.dtype)
+        outPis = np.empty((len(ids), *pis.shape[1:]), dtype=pis.dtype)
+        outVs = np.empty(len(ids), dtype=vs.dtype)
+        for shard in np.unique(shardIds):
+            mask = shardIds == shard
+            local = ids[mask] - self.offsets[shard]
+            boards, pis, vs = self.shards[shard]
+            outBoards[mask] = boards[local]
+            outPis[mask] = pis[local]
+            outVs[mask] = vs[local]
+        return outBoards, outPis, outVs
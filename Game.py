@@ -72,6 +72,19 @@ class Game():
         """
         pass
 
+    def getGameEndedAfterMove(self, board, player, action):
+        """
+        Input:
+            board: board after action was played
+            player: current player (1 or -1)
+            action: last action played on board
+
+        Returns:
+            r: same as getGameEnded(board, player). Games can override this to
+               only check what the last action could have changed.
+        """
+        return self.getGameEnded(board, player)
+
     def getCanonicalForm(self, board, player):
         """
         Input:
@@ -101,13 +114,175 @@ class Game():
         """
         pass
 
+    def getSymmetryPermutations(self):
+        """
+        Returns:
+            permutations: None, or an int array of shape (numSymmetries, actionSize)
+                          such that the symmetric forms returned by getSymmetries
+                          are board.ravel()[permutations[t]] and pi[permutations[t]].
+                          When a game provides it, Coach stores each example once
+                          and the network applies a random symmetry to every
+                          training batch instead.
+        """
+        return None
+
+    def getFeaturePlanes(self, board, action=None):
+        """
+        Input:
+            board: canonical board
+            action: the last move played on board, if known
+
+        Returns:
+            planes: the input of the neural network for board, or None if the
+                    network takes the board itself (the default)
+        """
+        return None
+
+    def getNextFeaturePlanes(self, planes, nextBoard, action):
+        """
+        Input:
+            planes: getFeaturePlanes of a canonical board
+            nextBoard: the canonical board reached by playing action from it
+            action: the action played
+
+        Returns:
+            nextPlanes: getFeaturePlanes(nextBoard, action). Games can override
+                        this to update planes incrementally.
+        """
+        return None if planes is None else self.getFeaturePlanes(nextBoard, action)
+
+    def getInputShape(self):
+        """
+        Returns:
+            shape: the shape of one input of the neural network, that of the
+                   feature planes if the game provides them and the board
+                   size otherwise
+        """
+        planes = self.getFeaturePlanes(self.getInitBoard())
+        return self.getBoardSize() if planes is None else planes.shape
+
+    def toBitboard(self, board):
+        """
+        Input:
+            board: canonical board
+
+        Returns:
+            bitboard: a compact hashable form of board that the bitboard
+                      methods below work on, or None if the game has none (the
+                      default). MCTS keeps the bitboards of its nodes instead
+                      of their boards when a game provides them.
+        """
+        return None
+
+    def fromBitboard(self, bitboard):
+        """
+        Returns:
+            board: the board of bitboard, as getInitBoard returns it
+        """
+        pass
+
+    def getNextBitboard(self, bitboard, action):
+        """
+        Input:
+            bitboard: toBitboard of a canonical board
+            action: action taken by player 1 on that board
+
+        Returns:
+            nextBitboard: toBitboard of the canonical board of the next player
+        """
+        pass
+
+    def getBitboardValidMoves(self, bitboard):
+        """
+        Returns:
+            validMoves: getValidMoves(fromBitboard(bitboard), 1)
+        """
+        pass
+
+    def getBitboardGameEnded(self, bitboard, action=None):
+        """
+        Input:
+            bitboard: toBitboard of a canonical board
+            action: the last move played on the board, if known, so that only
+                    the results it can have caused need to be checked
+
+        Returns:
+            r: getGameEnded(fromBitboard(bitboard), 1)
+        """
+        pass
+
+    def stateKey(self, board):
+        """
+        Input:
+            board: current board
+
+        Returns:
+            key: a compact hashable key that is equal for equal boards.
+                 Required by MCTS for hashing. Defaults to
+                 stringRepresentation, games should return something cheaper
+                 such as the raw bytes of the board.
+        """
+        return self.stringRepresentation(board)
+
+    def getZobristKeys(self, board):
+        """
+        Input:
+            board: current board in its canonical form
+
+        Returns:
+            keys: Zobrist keys of the board that getNextZobristKeys can update
+                  incrementally, as an np array. None if the game does not
+                  support Zobrist hashing.
+        """
+        return None
+
+    def getNextZobristKeys(self, keys, action):
+        """
+        Input:
+            keys: getZobristKeys of a canonical board
+            action: action taken by player 1 on that board
+
+        Returns:
+            nextKeys: getZobristKeys of the canonical board of the next player
+        """
+        return None
+
+    def getZobristClass(self, keys, action=None):
+        """
+        Input:
+            keys: getZobristKeys of a board
+            action: the last move played on the board, passed by MCTS if the
+                    network sees it (see getFeaturePlanes), in which case it
+                    has to be part of the key
+
+        Returns:
+            key: a hash shared by all boards that are symmetries of each other
+            symmetry: the symmetry that maps the board to the representative
+                      of its class, to be used with applySymmetry
+
+        Defaults to the hash of the board itself and no symmetry.
+        """
+        return keys[0], None
+
+    def applySymmetry(self, x, symmetry, inverse=False):
+        """
+        Input:
+            x: a board, or a policy vector of size self.getActionSize()
+            symmetry: a symmetry returned by getZobristClass
+            inverse: apply the inverse of the symmetry
+
+        Returns:
+            x transformed by the symmetry. Defaults to x itself.
+        """
+        return x
+
     def stringRepresentation(self, board):
         """
         Input:
             board: current board
 
         Returns:
-            boardString: a quick conversion of board to a string format.
-                         Required by MCTS for hashing.
+            boardString: a conversion of board to a string format, used to
+                         display boards.
         """
         pass
@@ -0,0 +1,117 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from time import time
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class InferenceServer():
+    """
+    Owns a single copy of a neural network and evaluates the boards submitted
+    by many concurrent games in batches.
+
+    Requests are collected until maxBatchSize boards are waiting or the oldest
+    board has waited maxWaitTime seconds, then they are evaluated with one
+    nnet.predict_batch call and the results are handed back through futures.
+
+    The server implements predict and predict_batch itself, so it can be given
+    to MCTS in place of the network by any number of threads.
+    """
+
+    def __init__(self, nnet, maxBatchSize=64, maxWaitTime=0.001):
+        self.nnet = nnet
+        self.maxBatchSize = maxBatchSize
+        self.maxWaitTime = maxWaitTime
+        self.requests = queue.Queue()
+        self.running = False
+        self.threads = []
+
+        self.numBatches = 0
+        self.numBoards = 0
+
+    @property
+    def version(self):
+        return self.nnet.version
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        """
+        Starts the thread that evaluates the batches.
+        """
+        self.running = True
+        self.threads = [threading.Thread(target=self.serve, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.running = False
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if self.numBatches > 0:
+            log.info(f'Inference server evaluated {self.numBoards} boards in {self.numBatches} batches '
+                     f'({self.numBoards / self.numBatches:.1f} boards per batch)')
+
+    def resetStats(self):
+        self.numBatches = 0
+        self.numBoards = 0
+
+    def submit(self, board):
+        """
+        Queues board for evaluation.
+
+        Returns:
+            future: resolves to (pi, v) once the batch containing board was evaluated
+        """
+        future = Future()
+        self.requests.put((board, future))
+        return future
+
+    def predict(self, board):
+        """
+        board: np array with board, blocks until it was evaluated
+        """
+        return self.submit(board).result()
+
+    def predict_batch(self, boards):
+        """
+        boards: list or stacked np array of boards, blocks until all were evaluated
+        """
+        futures = [self.submit(board) for board in boards]
+        pis, vs = zip(*[future.result() for future in futures])
+        return np.array(pis), np.ravel(vs)
+
+    def serve(self):
+        while self.running:
+            try:
+                batch = [self.requests.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            deadline = time() + self.maxWaitTime
+            while len(batch) < self.maxBatchSize:
+                try:
+                    batch.append(self.requests.get(timeout=max(0., deadline - time())))
+                except queue.Empty:
+                    break
+
+            boards, futures = zip(*batch)
+            try:
+                pis, vs = self.nnet.predict_batch(np.array(boards))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, pi, v in zip(futures, pis, vs):
+                future.set_result((pi, np.array([v])))
+            self.numBatches += 1
+            self.numBoards += len(batch)
@@ -1,9 +1,20 @@
 import logging
 import math
+from time import perf_counter
 
 import numpy as np
 
+from Profiler import Profiler, TimedCalls
+
 EPS = 1e-8
+INITIAL_CAPACITY = 256  # number of node rows allocated up front, doubled whenever the table is full
+# the timer of every game and network method that args.profileTimers times
+GAME_TIMERS = {'getGameEnded': 'getGameEnded', 'getGameEndedAfterMove': 'getGameEnded',
+               'getBitboardGameEnded': 'getGameEnded', 'getValidMoves': 'getValidMoves',
+               'getBitboardValidMoves': 'getValidMoves', 'stateKey': 'stateKey',
+               'getNextState': 'nextState', 'getCanonicalForm': 'nextState', 'getNextZobristKeys': 'nextState',
+               'getNextFeaturePlanes': 'nextState', 'getNextBitboard': 'nextState', 'fromBitboard': 'nextState'}
+NNET_TIMERS = {'predict': 'inference', 'predict_batch': 'inference'}
 
 log = logging.getLogger(__name__)
 
@@ -11,57 +22,118 @@ log = logging.getLogger(__name__)
 class MCTS():
     """
     This class handles the MCTS tree.
+
+    The tree is kept as a node table: every board s that the search reaches gets
+    one row, and the statistics of all edges (s,a) of that board are stored as
+    vectors of length game.getActionSize() in that row. Memory therefore grows
+    with the number of nodes instead of the number of edges, and children are
+    followed through row indices instead of being re-hashed.
+
+    If the game has bitboards (see Game.toBitboard) the rows hold them instead
+    of the boards: moves, valid moves and the end of the game are computed on
+    the bitboards, and a board is only converted back when the network needs it.
     """
 
-    def __init__(self, game, nnet, args):
+    def __init__(self, game, nnet, args, table=None, profiler=None):
+        """
+        Input:
+            table: an optional TranspositionTable that caches the network
+                   evaluations across trees. It is only used if the game
+                   supports Zobrist hashing and nnet has a version.
+            profiler: the Profiler that counts and times the search, trees
+                      of the same thread can share one. With
+                      args.profileTimers the calls of the game, the network
+                      and selectAction are timed as well.
+        """
         self.game = game
         self.nnet = nnet
         self.args = args
-        self.Qsa = {}  # stores Q values for s,a (as defined in the paper)
-        self.Nsa = {}  # stores #times edge s,a was visited
-        self.Ns = {}  # stores #times board s was visited
-        self.Ps = {}  # stores initial policy (returned by neural net)
+        self.actionSize = self.game.getActionSize()
+        self.table = table
+        self.profiler = profiler or Profiler()
+        if self.args.get('profileTimers', False):
+            self.game = TimedCalls(game, self.profiler, GAME_TIMERS)
+            self.nnet = TimedCalls(nnet, self.profiler, NNET_TIMERS)
+            self.selectAction = self.profiler.timed('selection', self.selectAction)
+
+        self.nodes = {}  # maps nodeKey of board s to its row in the node table
+        self.numNodes = 0
+        self.capacity = 0
+        self.root = None  # row of the board of the last getActionProb call
 
-        self.Es = {}  # stores game.getGameEnded ended for board s
-        self.Vs = {}  # stores game.getValidMoves for board s
+        self.Nsa = None  # row s: #times edge s,a was visited
+        self.Wsa = None  # row s: total value of edge s,a, Q(s,a) = Wsa / Nsa (as defined in the paper)
+        self.Ps = None  # row s: initial policy (returned by neural net)
+        self.Vs = None  # row s: game.getValidMoves for board s
+        self.children = None  # row s: row of the board reached by playing a from s, -1 if not created yet
+        self.Ns = None  # stores #times board s was visited
+        self.Es = None  # stores game.getGameEnded ended for board s
+        self.expanded = None  # whether the network has been evaluated for board s
+        self.boards = None  # canonical board of every row, not kept if the game has bitboards
+        self.bitboards = None  # game.toBitboard of the canonical board of every row, if the game has bitboards
+        self.hashes = None  # game.getZobristKeys of every row, only kept if a table is used
+        self.planes = None  # game.getFeaturePlanes of every row, only kept if the game provides them
+        self.lastActions = None  # last move played on the board of every row, -1 if unknown, kept with hashes and planes
 
-    def getActionProb(self, canonicalBoard, temp=1):
+    def getActionProb(self, canonicalBoard, temp=1, lastAction=None):
         """
         This function performs numMCTSSims simulations of MCTS starting from
-        canonicalBoard.
+        canonicalBoard. lastAction is the move that led to canonicalBoard, if
+        it is known; it is only used by games with feature planes.
+
+        If args.reuseTree is set, canonicalBoard becomes the root of the tree:
+        if it is already in the tree only its subtree is kept (see reroot), and
+        the visits it already has count towards the numMCTSSims simulations.
 
         Returns:
             probs: a policy vector where the probability of the ith action is
                    proportional to Nsa[(s,a)]**(1./temp)
         """
-        for i in range(self.args.numMCTSSims):
-            self.search(canonicalBoard)
+        start = perf_counter()
+        numSims = self.args.numMCTSSims
+        if self.args.get('reuseTree', False):
+            self.setRoot(canonicalBoard, lastAction)
+            numSims -= int(self.Ns[self.root])
+        else:
+            self.root = self.getNode(canonicalBoard, lastAction)
+
+        batchSize = self.args.get('mctsBatchSize', 1)
+        if batchSize > 1:
+            done = 0
+            if numSims > 0 and not self.expanded[self.root]:
+                self.search()  # expands the root so the first batch can spread out
+                done = 1
+            while done < numSims:
+                done += self.searchBatch(min(batchSize, numSims - done))
+        else:
+            for i in range(numSims):
+                self.search()
+        self.profiler.count('simulations', max(numSims, 0))
+        self.profiler.addTime('search', perf_counter() - start)
 
-        s = self.game.stringRepresentation(canonicalBoard)
-        counts = [self.Nsa[(s, a)] if (s, a) in self.Nsa else 0 for a in range(self.game.getActionSize())]
+        counts = self.Nsa[self.root].astype(np.float64)
 
         if temp == 0:
             bestAs = np.array(np.argwhere(counts == np.max(counts))).flatten()
             bestA = np.random.choice(bestAs)
-            probs = [0] * len(counts)
+            probs = np.zeros(len(counts))
             probs[bestA] = 1
             return probs
 
-        counts = [x ** (1. / temp) for x in counts]
-        counts_sum = float(sum(counts))
-        probs = [x / counts_sum for x in counts]
+        counts = counts ** (1. / temp)
+        probs = counts / np.sum(counts)
         return probs
 
-    def search(self, canonicalBoard):
+    def search(self):
         """
-        This function performs one iteration of MCTS. It is recursively called
-        till a leaf node is found. The action chosen at each node is one that
-        has the maximum upper confidence bound as in the paper.
+        This function performs one iteration of MCTS. It descends the tree from
+        the root till a leaf node is found. The action chosen at each node
+        is one that has the maximum upper confidence bound as in the paper.
 
         Once a leaf node is found, the neural network is called to return an
         initial policy P and a value v for the state. This value is propagated
         up the search path. In case the leaf node is a terminal state, the
-        outcome is propagated up the search path. The values of Ns, Nsa, Qsa are
+        outcome is propagated up the search path. The rows of Ns, Nsa, Wsa are
         updated.
 
         NOTE: the return values are the negative of the value of the current
@@ -69,68 +141,455 @@ class MCTS():
         state for the current player, then its value is -v for the other player.
 
         Returns:
-            v: the negative of the value of the current canonicalBoard
+            v: the negative of the value of the root
         """
+        s = self.root
+        path = []
+        while True:
+            if self.Es[s] != 0:
+                # terminal node
+                v = -self.Es[s]
+                break
+            if not self.expanded[s]:
+                # leaf node
+                v = -self.expand(s)
+                break
 
-        s = self.game.stringRepresentation(canonicalBoard)
+            a = self.selectAction(s)
+            path.append((s, a))
+            s = self.getChild(s, a)
 
-        if s not in self.Es:
-            self.Es[s] = self.game.getGameEnded(canonicalBoard, 1)
-        if self.Es[s] != 0:
-            # terminal node
-            return -self.Es[s]
+        # propagate the value up the search path, flipping the sign at every ply
+        for s, a in reversed(path):
+            self.Wsa[s, a] += v
+            self.Nsa[s, a] += 1
+            self.Ns[s] += 1
+            v = -v
+        return v
 
-        if s not in self.Ps:
-            # leaf node
-            self.Ps[s], v = self.nnet.predict(canonicalBoard)
-            valids = self.game.getValidMoves(canonicalBoard, 1)
-            self.Ps[s] = self.Ps[s] * valids  # masking invalid moves
-            sum_Ps_s = np.sum(self.Ps[s])
-            if sum_Ps_s > 0:
-                self.Ps[s] /= sum_Ps_s  # renormalize
-            else:
-                # if all valid moves were masked make all valid moves equally probable
-
-                # NB! All valid moves may be masked if either your NNet architecture is insufficient or you've get overfitting or something else.
-                # If you have got dozens or hundreds of these messages you should pay attention to your NNet and/or training process.   
-                log.error("All valid moves were masked, doing a workaround.")
-                self.Ps[s] = self.Ps[s] + valids
-                self.Ps[s] /= np.sum(self.Ps[s])
-
-            self.Vs[s] = valids
-            self.Ns[s] = 0
-            return -v
-
-        valids = self.Vs[s]
-        cur_best = -float('inf')
-        best_act = -1
-
-        # pick the action with the highest upper confidence bound
-        for a in range(self.game.getActionSize()):
-            if valids[a]:
-                if (s, a) in self.Qsa:
-                    u = self.Qsa[(s, a)] + self.args.cpuct * self.Ps[s][a] * math.sqrt(self.Ns[s]) / (
-                            1 + self.Nsa[(s, a)])
+    def advance(self, action):
+        """
+        Makes the child reached by playing action from the root of the last
+        getActionProb call the new root, keeping its subtree with all its
+        visits and freeing the rest of the tree. Call it after a move was
+        chosen, and after the opponent's reply if it is known.
+        """
+        if self.root is None:
+            return
+        child = self.children[self.root, action]
+        if child < 0:
+            self.reset()
+        else:
+            self.reroot(child)
+
+    def setRoot(self, canonicalBoard, lastAction=None):
+        """
+        Makes canonicalBoard the root, keeping its subtree if it is in the tree
+        and starting a new tree otherwise.
+        """
+        s = self.nodes.get(self.nodeKey(canonicalBoard, lastAction))
+        if s is None:
+            self.reset()
+            self.root = self.getNode(canonicalBoard, lastAction)
+        elif s != self.root:
+            self.reroot(s)
+
+    def reroot(self, root):
+        """
+        Makes row root the root of the tree. The rows reachable from it are
+        moved to the front of the node table and all other rows are freed.
+        """
+        keep = np.zeros(self.numNodes, dtype=bool)
+        keep[root] = True
+        frontier = np.array([root])
+        while len(frontier) > 0:
+            children = self.children[frontier].ravel()
+            children = np.unique(children[children >= 0])
+            frontier = children[~keep[children]]
+            keep[frontier] = True
+
+        rows = np.flatnonzero(keep)
+        newRows = np.full(self.numNodes, -1, dtype=np.int32)
+        newRows[rows] = np.arange(len(rows))
+        for array in (self.Nsa, self.Wsa, self.Ps, self.Vs, self.Ns, self.Es, self.expanded, self.boards,
+                      self.bitboards, self.hashes, self.planes, self.lastActions):
+            if array is not None:
+                array[:len(rows)] = array[rows]
+        children = self.children[rows]
+        self.children[:len(rows)] = np.where(children >= 0, newRows[children], -1)
+
+        self.clearRows(len(rows), self.numNodes)
+        self.nodes = {key: int(newRows[s]) for key, s in self.nodes.items() if keep[s]}
+        self.numNodes = len(rows)
+        self.root = int(newRows[root])
+
+    def reset(self):
+        """
+        Frees the whole tree.
+        """
+        if self.numNodes > 0:
+            self.clearRows(0, self.numNodes)
+        self.nodes = {}
+        self.numNodes = 0
+        self.root = None
+
+    def clearRows(self, start, end):
+        self.Nsa[start:end] = 0
+        self.Wsa[start:end] = 0
+        self.Ns[start:end] = 0
+        self.children[start:end] = -1
+        self.expanded[start:end] = False
+
+    def searchBatch(self, batchSize):
+        """
+        Performs up to batchSize iterations of MCTS from the root with a single
+        call to the neural network.
+
+        The paths are descended one after the other. Every edge on a path gets a
+        virtual loss of args.virtualLoss (visits that count as losses) so that
+        the following paths are steered towards other leaves. The leaf boards of
+        all paths are then evaluated in one nnet.predict_batch call, the virtual
+        losses are removed and the real values are propagated up every path.
+        A path that runs into a leaf already collected in this batch is
+        abandoned and does not count as a simulation.
+
+        Returns:
+            done: the number of simulations that were performed
+        """
+        virtualLoss = self.args.get('virtualLoss', 1)
+        root = self.root
+        leaves = {}  # row of each unexpanded leaf -> its position in the batch
+        paths = []  # (path, row of the leaf or None, value if the leaf is terminal)
+        for _ in range(batchSize):
+            s = root
+            path = []
+            while self.Es[s] == 0 and self.expanded[s]:
+                a = self.selectAction(s)
+                path.append((s, a))
+                self.Nsa[s, a] += virtualLoss
+                self.Wsa[s, a] -= virtualLoss
+                self.Ns[s] += virtualLoss
+                s = self.getChild(s, a)
+
+            if self.Es[s] != 0:
+                # terminal node
+                paths.append((path, None, -self.Es[s]))
+            elif s not in leaves:
+                # leaf node
+                entry = self.lookup(s)
+                if entry is not None:
+                    self.setPolicy(s, entry[0])
+                    paths.append((path, None, -entry[1]))
                 else:
-                    u = self.args.cpuct * self.Ps[s][a] * math.sqrt(self.Ns[s] + EPS)  # Q = 0 ?
+                    leaves[s] = len(leaves)
+                    paths.append((path, s, None))
+            else:
+                # collision with a leaf of this batch, undo the virtual loss
+                for s, a in path:
+                    self.Nsa[s, a] -= virtualLoss
+                    self.Wsa[s, a] += virtualLoss
+                    self.Ns[s] -= virtualLoss
 
-                if u > cur_best:
-                    cur_best = u
-                    best_act = a
+        if leaves:
+            rows = list(leaves)
+            pis, vs = self.nnet.predict_batch([self.evaluationBoard(s) for s in rows])
+            self.profiler.count('networkCalls')
+            self.profiler.count('networkBoards', len(rows))
+            for s, pi, v in zip(rows, pis, vs):
+                self.setPolicy(s, self.store(s, pi, v))
 
-        a = best_act
-        next_s, next_player = self.game.getNextState(canonicalBoard, 1, a)
-        next_s = self.game.getCanonicalForm(next_s, next_player)
+        for path, leaf, v in paths:
+            if leaf is not None:
+                v = -vs[leaves[leaf]]
+            for s, a in reversed(path):
+                self.Wsa[s, a] += v + virtualLoss
+                self.Nsa[s, a] += 1 - virtualLoss
+                self.Ns[s] += 1 - virtualLoss
+                v = -v
+        return len(paths)
 
-        v = self.search(next_s)
+    def selectAction(self, s):
+        """
+        Returns the valid action of row s with the highest upper confidence
+        bound. The bound is computed for all children at once, ties are broken
+        uniformly at random.
+        """
+        Nsa = self.Nsa[s]
+        Qsa = self.Wsa[s] / np.maximum(Nsa, 1)  # Q = 0 for unvisited edges
+        u = Qsa + self.args.cpuct * self.Ps[s] * math.sqrt(self.Ns[s] + EPS) / (1 + Nsa)
+        u[self.Vs[s] == 0] = -np.inf
+        bestAs = np.flatnonzero(u == u.max())
+        if len(bestAs) == 1:
+            return bestAs[0]
+        return np.random.choice(bestAs)
 
-        if (s, a) in self.Qsa:
-            self.Qsa[(s, a)] = (self.Nsa[(s, a)] * self.Qsa[(s, a)] + v) / (self.Nsa[(s, a)] + 1)
-            self.Nsa[(s, a)] += 1
+    def expand(self, s):
+        """
+        Evaluates the board of row s with the neural network and stores the
+        masked policy in its row.
 
+        Returns:
+            v: the value of the board for the current player
+        """
+        entry = self.lookup(s)
+        if entry is not None:
+            Ps, v = entry
         else:
-            self.Qsa[(s, a)] = v
-            self.Nsa[(s, a)] = 1
+            Ps, v = self.nnet.predict(self.evaluationBoard(s))
+            self.profiler.count('networkCalls')
+            self.profiler.count('networkBoards')
+            v = np.ravel(v)[0]
+            Ps = self.store(s, Ps, v)
+        self.setPolicy(s, Ps)
+        return v
+
+    def lookup(self, s):
+        """
+        Returns:
+            (Ps, v): the evaluation of the board of row s stored in the
+                     transposition table, None if there is none
+        """
+        if self.hashes is None:
+            return None
+        key, symmetry = self.zobristClass(s)
+        entry = self.table.get(int(key), self.nnet.version)
+        if entry is None:
+            self.profiler.count('cacheMisses')
+            return None
+        self.profiler.count('cacheHits')
+        return self.game.applySymmetry(entry[0], symmetry, inverse=True), entry[1]
+
+    def evaluationBoard(self, s):
+        """
+        Returns the board, or the feature planes if the game provides them, to
+        evaluate for row s. If a transposition table is used this is the
+        representative of the symmetry class of the board, so that symmetric
+        boards share one evaluation and one table entry.
+        """
+        board = self.board(s) if self.planes is None else self.planes[s]
+        if self.hashes is None:
+            return board
+        return self.game.applySymmetry(board, self.zobristClass(s)[1])
+
+    def zobristClass(self, s):
+        """
+        Returns game.getZobristClass of the board of row s. With feature planes
+        the last move is part of the network input, so it is part of the key.
+        """
+        if self.lastActions is None or self.lastActions[s] < 0:
+            return self.game.getZobristClass(self.hashes[s])
+        return self.game.getZobristClass(self.hashes[s], self.lastActions[s])
 
-        self.Ns[s] += 1
-        return -v
+    def store(self, s, Ps, v):
+        """
+        Stores the network evaluation Ps, v of evaluationBoard(s) in the
+        transposition table.
+
+        Returns:
+            Ps: the policy mapped back onto the board of row s
+        """
+        if self.hashes is None:
+            return Ps
+        key, symmetry = self.zobristClass(s)
+        self.table.put(int(key), self.nnet.version, Ps, v)
+        return self.game.applySymmetry(Ps, symmetry, inverse=True)
+
+    def setPolicy(self, s, Ps):
+        """
+        Masks the network policy Ps with the valid moves of row s and stores it
+        as the prior of the row.
+        """
+        if self.bitboards is None:
+            valids = self.game.getValidMoves(self.boards[s], 1)
+        else:
+            valids = self.game.getBitboardValidMoves(self.bitboards[s])
+        self.profiler.count('expansions')
+        Ps = Ps * valids  # masking invalid moves
+        sum_Ps_s = np.sum(Ps)
+        if sum_Ps_s > 0:
+            Ps /= sum_Ps_s  # renormalize
+        else:
+            # if all valid moves were masked make all valid moves equally probable
+
+            # NB! All valid moves may be masked if either your NNet architecture is insufficient or you've get overfitting or something else.
+            # If you have got dozens or hundreds of these messages you should pay attention to your NNet and/or training process.
+            log.error("All valid moves were masked, doing a workaround.")
+            Ps = Ps + valids
+            Ps /= np.sum(Ps)
+
+        self.Ps[s] = Ps
+        self.Vs[s] = valids
+        self.expanded[s] = True
+
+    def getChild(self, s, a):
+        """
+        Returns the row of the board reached by playing a from row s, creating
+        it if it does not exist yet.
+        """
+        child = self.children[s, a]
+        if child < 0:
+            if self.bitboards is None:
+                next_s, next_player = self.game.getNextState(self.boards[s], 1, a)
+                next_s = self.game.getCanonicalForm(next_s, next_player)
+                bitboard = None
+            else:
+                bitboard = self.game.getNextBitboard(self.bitboards[s], a)
+                # the board is only needed to update the feature planes
+                next_s = None if self.planes is None else self.game.fromBitboard(bitboard)
+            hashKeys = None if self.hashes is None else self.game.getNextZobristKeys(self.hashes[s], a)
+            planes = None if self.planes is None else self.game.getNextFeaturePlanes(self.planes[s], next_s, a)
+            child = self.getNode(next_s, a, hashKeys, planes, bitboard)
+            self.children[s, a] = child
+        return child
+
+    def getNode(self, canonicalBoard, action=None, hashKeys=None, planes=None, bitboard=None):
+        """
+        Returns the row of canonicalBoard, adding a new row if the board has not
+        been seen before. action is the last move played on canonicalBoard, and
+        hashKeys, planes and bitboard its Zobrist keys, feature planes and
+        bitboard if they are known. canonicalBoard may be None if its bitboard
+        and its planes are given.
+        """
+        if self.capacity == 0:
+            self.grow(canonicalBoard)
+        if self.bitboards is not None and bitboard is None:
+            bitboard = self.game.toBitboard(canonicalBoard)
+        key = self.nodeKey(canonicalBoard, action, bitboard)
+        s = self.nodes.get(key)
+        if s is None:
+            if self.numNodes == self.capacity:
+                self.grow()
+            s = self.numNodes
+            self.numNodes += 1
+            self.nodes[key] = s
+            if self.bitboards is None:
+                self.boards[s] = canonicalBoard
+            else:
+                self.bitboards[s] = bitboard
+            if self.hashes is not None:
+                self.hashes[s] = self.game.getZobristKeys(canonicalBoard) if hashKeys is None else hashKeys
+            if self.planes is not None:
+                self.planes[s] = self.game.getFeaturePlanes(canonicalBoard, action) if planes is None else planes
+            if self.lastActions is not None:
+                self.lastActions[s] = -1 if action is None else action
+            if bitboard is not None:
+                self.Es[s] = self.game.getBitboardGameEnded(bitboard, action)
+            elif action is None:
+                self.Es[s] = self.game.getGameEnded(canonicalBoard, 1)
+            else:
+                self.Es[s] = self.game.getGameEndedAfterMove(canonicalBoard, 1, action)
+            self.profiler.count('nodes')
+        return s
+
+    def nodeKey(self, canonicalBoard, action=None, bitboard=None):
+        """
+        Returns the key in self.nodes of canonicalBoard reached by the move
+        action: game.stateKey of the board, or its bitboard. With feature
+        planes the network sees the last move, so the key includes it and the
+        same stones reached by different moves are different nodes.
+        """
+        if bitboard is None and self.bitboards is not None:
+            bitboard = self.game.toBitboard(canonicalBoard)
+        key = self.game.stateKey(canonicalBoard) if bitboard is None else bitboard
+        if self.planes is None:
+            return key
+        return key, -1 if action is None else int(action)
+
+    def board(self, s):
+        """
+        Returns the canonical board of row s.
+        """
+        if self.bitboards is None:
+            return self.boards[s]
+        return self.game.fromBitboard(self.bitboards[s])
+
+    def useTable(self, board):
+        """
+        Whether the transposition table can be used with this game and network.
+        """
+        return self.table is not None and getattr(self.nnet, 'version', None) is not None \
+            and self.game.getZobristKeys(board) is not None
+
+    def grow(self, board=None):
+        """
+        Doubles the capacity of the node table. The first call allocates it and
+        needs a board to decide which columns to keep and to size them.
+        """
+        capacity = max(INITIAL_CAPACITY, 2 * self.capacity)
+
+        def resize(array, shape=(), dtype=None, fill=0):
+            if array is not None:
+                shape, dtype = array.shape[1:], array.dtype
+            new = np.full((capacity, *shape), fill, dtype=dtype)
+            if array is not None:
+                new[:self.capacity] = array
+            return new
+
+        self.Nsa = resize(self.Nsa, (self.actionSize,), np.int32)
+        self.Wsa = resize(self.Wsa, (self.actionSize,), np.float64)
+        self.Ps = resize(self.Ps, (self.actionSize,), np.float64)
+        self.Vs = resize(self.Vs, (self.actionSize,), np.int8)
+        self.children = resize(self.children, (self.actionSize,), np.int32, fill=-1)
+        self.Ns = resize(self.Ns, dtype=np.int32)
+        self.Es = resize(self.Es, dtype=np.float64)
+        self.expanded = resize(self.expanded, dtype=bool)
+        if self.capacity > 0:
+            for name in ('boards', 'bitboards', 'hashes', 'planes', 'lastActions'):
+                if getattr(self, name) is not None:
+                    setattr(self, name, resize(getattr(self, name)))
+        else:
+            if self.game.toBitboard(board) is not None:
+                self.bitboards = resize(None, dtype=object, fill=None)
+            else:
+                self.boards = resize(None, np.shape(board), np.asarray(board).dtype)
+            if self.useTable(board):
+                self.hashes = resize(None, np.shape(self.game.getZobristKeys(board)), np.uint64)
+            planes = self.game.getFeaturePlanes(board)
+            if planes is not None:
+                self.planes = resize(None, np.shape(planes), planes.dtype)
+                if self.hashes is not None:
+                    self.lastActions = resize(None, dtype=np.int32, fill=-1)
+        self.capacity = capacity
+
+
+class MCTSPlayer():
+    """
+    Arena player that plays the most visited move of an MCTS. The feature
+    planes need the opponent's last move: the arenas pass it, other callers
+    that only have the board get it from getLastAction, which compares the
+    board with the one left after the player's previous move.
+    """
+
+    takesLastAction = True  # see Arena.play
+
+    def __init__(self, mcts):
+        self.mcts = mcts
+        self.previous = None  # canonical board after our last move
+
+    def __call__(self, canonicalBoard, lastAction=None):
+        if lastAction is None:
+            lastAction = self.getLastAction(canonicalBoard)
+        action = int(np.argmax(self.mcts.getActionProb(canonicalBoard, temp=0, lastAction=lastAction)))
+        self.played(canonicalBoard, action)
+        return action
+
+    def getLastAction(self, canonicalBoard):
+        """
+        Returns:
+            action: the move of the opponent that led to canonicalBoard, None
+                    if canonicalBoard does not follow our previous move, e.g.
+                    at the start of a game
+        """
+        if self.previous is None or np.shape(self.previous) != np.shape(canonicalBoard):
+            return None
+        changed = np.flatnonzero(np.ravel(canonicalBoard) != np.ravel(self.previous))
+        if len(changed) != 1 or self.previous.flat[changed[0]] != 0:
+            return None
+        return int(changed[0])
+
+    def played(self, canonicalBoard, action):
+        """
+        Remembers the board after our move action on canonicalBoard.
+        """
+        self.previous = np.array(canonicalBoard)
+        self.previous.flat[action] = 1
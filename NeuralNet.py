@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class NeuralNet():
     """
     This class specifies the base NeuralNet class. To define your own neural
@@ -8,6 +11,8 @@ class NeuralNet():
     See othello/NNet.py for an example implementation.
     """
 
+    version = None  # identifies the current weights, see TranspositionTable
+
     def __init__(self, game):
         pass
 
@@ -36,6 +41,23 @@ class NeuralNet():
         """
         pass
 
+    def predict_batch(self, boards):
+        """
+        Input:
+            boards: a list or a stacked np array of boards in their canonical
+                    form.
+
+        Returns:
+            pis: np array of shape (len(boards), game.getActionSize) with the
+                 policy vector of every board
+            vs: np array with the value of every board
+
+        Implementations should evaluate all boards in one pass through the
+        network. The default calls predict once for every board.
+        """
+        pis, vs = zip(*[self.predict(board) for board in boards])
+        return np.array(pis), np.ravel(vs)
+
     def save_checkpoint(self, folder, filename):
         """
         Saves the current neural network (with its parameters) in
@@ -48,3 +70,11 @@ class NeuralNet():
         Loads parameters of the neural network from folder/filename
         """
         pass
+
+    def export_checkpoint(self, folder, filename, quantize=False):
+        """
+        Optional. Saves the current neural network in a form that is faster to
+        evaluate next to folder/filename, and returns the path of the file.
+        load_checkpoint should accept that file.
+        """
+        pass
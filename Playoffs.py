@@ -2,18 +2,22 @@ import os
 import pickle
 import sys
 
-from ArenaParallel import Arena
+from Tournament import Tournament
 from gomaku.GomakuGame import GomakuGame
 # from gomaku.GomakuPlayers import RandomPlayer
 from utils import dotdict
 
 
-def start_playoff(base_path, network_type, run_type, num_workers=1, worker_index=0):
+def find_checkpoints(base_path, network_type, run_type):
+    """
+    Returns a dict from the name "{run_type}-{run}/{file}" of every checkpoint
+    of the runs base_path/network_type/{run_type}-1, -2, ... to its path.
+    """
     def get_run_path(network_type, run_type, index):
         return os.path.join(base_path, network_type, f"{run_type}-{index}")
 
     run_count = 1
-    checkpoints = []
+    checkpoints = {}
     while True:
         pth = get_run_path(network_type, run_type, run_count)
         if not os.path.exists(pth):
@@ -25,85 +29,66 @@ def start_playoff(base_path, network_type, run_type, num_workers=1, worker_index
                 num = int(inter.split(".")[0])
                 local_checkpoints.append((num, file))
         local_checkpoints.sort()
-        for checkpoint in local_checkpoints:
-            checkpoints.append((run_count, *checkpoint))
+        for _, file in local_checkpoints:
+            checkpoints[f"{run_type}-{run_count}/{file}"] = os.path.join(pth, file)
         run_count += 1
-
-    data_path = os.path.join(base_path, network_type, f"{run_type}.playoffs")
-    global data
-    data = {
-        # (run_num, iteration, checkpoint): { (run_num, iteration, checkpoint): { stats: (wins, losses, draws) } }
-    }
-
-    def save_data(data):
-        pickle.dump(data, open(data_path, "wb"))
-
-    def load_data():
-        return pickle.load(open(data_path, "rb"))
-
-    if os.path.exists(data_path):
-        data = load_data()
-
-    print(checkpoints)
-
-    def get_path(checkpoint):
-        run, index, filename = checkpoint
-        return os.path.join(base_path, network_type, f"{run_type}-{run}", filename)
-
-    game = GomakuGame(8)
-
-    def run_playoff(p1_checkpoint, p2_checkpoint, to=100):
-        global data
-        # Plays games between the two checkpoints until data has [to] games in it
-        if p1_checkpoint not in data:
-            data[p1_checkpoint] = {}
-        data_p1 = data[p1_checkpoint]
-        if p2_checkpoint not in data_p1:
-            data_p1[p2_checkpoint] = {"stats": (0, 0, 0)}
-        save_data(data)
-        data_playoff = data_p1[p2_checkpoint]
-        stats = data_playoff["stats"]
-        data = load_data()  # Reload in case another worker already played this
-        already_played = sum(stats)
-        to_play = to - already_played
-        if to_play > 0:
-            print(f"Starting playoff between [Run: {p1_checkpoint[0]}, Checkpoint: {p1_checkpoint[1]}] and [Run: {p2_checkpoint[0]}, Checkpoint: {p2_checkpoint[1]}]")
-            arena = Arena(get_path(p1_checkpoint), get_path(p2_checkpoint), 2, game, args=dotdict({'numMCTSSims': 100, 'cpuct': 1.0}), names=(f"w-{worker_index}-p1", f"w-{worker_index}-p2"))
-            wins_p1, wins_p2, draws = arena.playGamesParallel(to_play, log=False)
-            new_stats = (stats[0] + wins_p1, stats[1] + wins_p2, stats[2] + draws)
-            data = load_data()  # Need to reload data in case a parallel worker wrote new data
-            data[p1_checkpoint][p2_checkpoint]["stats"] = new_stats
-            print(f"Stats: {new_stats}")
-            save_data(data)  # Immediately save data so that other workers can update
-            print(f"Saved: {data[p1_checkpoint]}")
-        else:
-            print(f"No games left to play for [Run: {p1_checkpoint[0]}, Checkpoint: {p1_checkpoint[1]}] and [Run: {p2_checkpoint[0]}, Checkpoint: {p2_checkpoint[1]}]")
-
-    def playoffs(to=100):
-        # Runs playoffs for every pair of checkpoints
-        to_play = len(checkpoints)/num_workers
-        start = int(round(to_play*worker_index))
-        end = int(round(to_play*(worker_index+1)))
-        global data
-        for p1 in reversed(checkpoints):
-            for p2 in checkpoints[start:end]:
-                run_playoff(p1, p2, to)
-                print("\n")
-
-    playoffs(to=100)
+    return checkpoints
+
+
+def import_playoffs(data_path, store, run_type):
+    """
+    Adds the results of a .playoffs pickle written by the old playoffs, a dict
+    {(run, iteration, file): {(run, iteration, file): {"stats": (wins, losses, draws)}}},
+    to the ResultStore store.
+    """
+    data = pickle.load(open(data_path, "rb"))
+    for (run1, _, file1), opponents in data.items():
+        for (run2, _, file2), playoff in opponents.items():
+            p1, p2 = f"{run_type}-{run1}/{file1}", f"{run_type}-{run2}/{file2}"
+            if p1 != p2 and sum(playoff["stats"]) > 0:
+                store.record(p1, p2, *playoff["stats"], worker="playoffs")
+
+
+def start_playoff(base_path, network_type, run_type, num_workers=1, games_per_pair=100, max_games=None):
+    """
+    Plays games_per_pair games between every pair of checkpoints, or if
+    max_games is given, plays up to max_games games on the pairs that tell the
+    most about the ratings (see Tournament.adaptive), and prints the ladder.
+    """
+    checkpoints = find_checkpoints(base_path, network_type, run_type)
+    print(list(checkpoints))
+
+    # SQLite needs a local disk, so the results live next to this script and not on the drive
+    store_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{network_type}-{run_type}.playoffs.sqlite")
+    tournament = Tournament(checkpoints, store_path, GomakuGame(8), args=dotdict({'numMCTSSims': 100, 'cpuct': 1.0}),
+                            numWorkers=num_workers)
+    legacy_path = os.path.join(base_path, network_type, f"{run_type}.playoffs")
+    if len(tournament.store) == 0 and os.path.exists(legacy_path):
+        import_playoffs(legacy_path, tournament.store, run_type)
+
+    if max_games is None:
+        tournament.roundRobin(games_per_pair)
+        ratings = tournament.ratings()
+    else:
+        ratings = tournament.adaptive(max_games)
+    for player, rating, low, high, games in ratings.ladder():
+        print(f"{player}: {rating:.0f} Elo ({low:.0f} to {high:.0f}) in {games} games")
 
 
 if __name__ == "__main__":
+    # python Playoffs.py [num_workers] [games_per_pair] [max_games for an adaptive tournament]
     num_workers = 1
-    worker_index = 0
+    games_per_pair = 100
+    max_games = None
     if len(sys.argv) > 1:
         num_workers = int(sys.argv[1])
     if len(sys.argv) > 2:
-        worker_index = int(sys.argv[2])
-    if num_workers > 1:
-        print(f"Starting playoffs with {num_workers} workers. I am worker {worker_index}.")
+        games_per_pair = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        max_games = int(sys.argv[3])
+    print(f"Starting playoffs with {num_workers} workers.")
 
     base_path = "/content/drive/MyDrive/School/Hey, you're an engineer now/ESC190/"
     network_type = "OriginalNetwork"
     run_type = "100-20-Checkpoints"
-    start_playoff(base_path, network_type, run_type, num_workers, worker_index)
\ No newline at end of file
+    start_playoff(base_path, network_type, run_type, num_workers, games_per_pair, max_games)
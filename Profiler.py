@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+from collections import defaultdict
+from time import perf_counter
+
+log = logging.getLogger(__name__)
+
+
+class Profiler():
+    """
+    Counters and timers of the search, cheap enough to be always on: a counter
+    is an integer and a timer the sum of the seconds of its calls, both keyed
+    by name. MCTS fills in
+
+    counters: simulations, nodes (rows created), expansions (boards whose
+              policy was set), networkCalls, networkBoards (boards evaluated
+              by those calls), cacheHits, cacheMisses (TranspositionTable)
+              and Coach adds serverBatches and serverBoards (InferenceServer)
+    timers:   search (all of getActionProb), and with args.profileTimers
+              selection, getGameEnded, getValidMoves, stateKey, nextState
+              and inference
+
+    Profilers are not thread safe, threads keep their own and merge them.
+    """
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.times = defaultdict(float)
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+
+    def addTime(self, name, seconds):
+        self.times[name] += seconds
+
+    def timed(self, name, function):
+        """
+        Returns function wrapped so that the time of its calls is added to the
+        timer name.
+        """
+        times = self.times
+
+        def timedFunction(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                times[name] += perf_counter() - start
+        return timedFunction
+
+    def merge(self, other):
+        """
+        Adds the counters and timers of other, a Profiler or a snapshot().
+        """
+        if isinstance(other, Profiler):
+            other = other.snapshot()
+        for name, n in other['counts'].items():
+            self.counts[name] += n
+        for name, seconds in other['times'].items():
+            self.times[name] += seconds
+
+    def snapshot(self):
+        """
+        Returns the counters and timers as a picklable dict, to send them to
+        another process.
+        """
+        return {'counts': dict(self.counts), 'times': dict(self.times)}
+
+    def pop(self):
+        """
+        Returns snapshot() and resets the profiler.
+        """
+        snapshot = self.snapshot()
+        self.reset()
+        return snapshot
+
+    def reset(self):
+        self.counts.clear()
+        self.times.clear()
+
+    def summary(self):
+        """
+        Returns:
+            summary: dict with the counters, the timers rounded to ms and the
+                     rates derived from them
+        """
+        counts, times = self.counts, self.times
+        summary = dict(counts)
+        summary['seconds'] = {name: round(seconds, 3) for name, seconds in sorted(times.items())}
+        if times.get('search', 0) > 0:
+            summary['simulationsPerSecond'] = round(counts.get('simulations', 0) / times['search'], 1)
+        if counts.get('networkCalls', 0) > 0:
+            summary['boardsPerNetworkCall'] = round(counts.get('networkBoards', 0) / counts['networkCalls'], 2)
+        if counts.get('serverBatches', 0) > 0:
+            summary['boardsPerServerBatch'] = round(counts.get('serverBoards', 0) / counts['serverBatches'], 2)
+        lookups = counts.get('cacheHits', 0) + counts.get('cacheMisses', 0)
+        if lookups > 0:
+            summary['cacheHitRate'] = round(counts.get('cacheHits', 0) / lookups, 4)
+        return summary
+
+
+class TimedCalls():
+    """
+    Stands in for obj, forwarding all attributes to it, but times the methods
+    named in timers (a dict from method name to timer name) with profiler.
+    """
+
+    def __init__(self, obj, profiler, timers):
+        self.obj = obj
+        for method, timer in timers.items():
+            if hasattr(obj, method):
+                setattr(self, method, profiler.timed(timer, getattr(obj, method)))
+
+    def __getattr__(self, name):
+        return getattr(self.obj, name)
+
+
+def writeSummary(path, summary):
+    """
+    Logs summary and appends it to the file path as a JSON line, if path is
+    not None.
+    """
+    line = json.dumps(summary, default=float)
+    log.info(line)
+    if path is not None:
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, 'a') as f:
+            f.write(line + '\n')
@@ -39,11 +39,12 @@ def play_gomoku_auto(player_1: Player, player_2: Player, r_seed=None, verbose=Fa
         if verbose:
             print(f"\n\n**************\nWhite move:({move_y}, {move_x})")
             print(f"Using checkpoint: {player_1.checkpoint}")
-        board = game.getNextState(board, 1, player_1.yx_to_action(move_y, move_x))[0]
+        action = player_1.yx_to_action(move_y, move_x)
+        board = game.getNextState(board, 1, action)[0]
 
         if verbose:
             print_board(game, board)
-        game_res = game.getGameEnded(board, 1)
+        game_res = game.getGameEndedAfterMove(board, 1, action)
         if game_res != 0:
             winner = get_winner(game_res)
             if verbose:
@@ -58,11 +59,12 @@ def play_gomoku_auto(player_1: Player, player_2: Player, r_seed=None, verbose=Fa
         if verbose:
             print(f"\n\n**************\nBlack move:({move_y}, {move_x})")
             print(f"Using checkpoint: {player_2.checkpoint}")
-        board = game.getNextState(board, -1, player_2.yx_to_action(move_y, move_x))[0]
+        action = player_2.yx_to_action(move_y, move_x)
+        board = game.getNextState(board, -1, action)[0]
 
         if verbose:
             print_board(game, board)
-        game_res = game.getGameEnded(board, 1)
+        game_res = game.getGameEndedAfterMove(board, 1, action)
         if game_res != 0:
             winner = get_winner(game_res)
             if verbose:
@@ -0,0 +1,141 @@
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+ELO = 400 / math.log(10)  # Elo points per unit of the natural Bradley-Terry scale
+
+
+class Ratings():
+    """
+    Bradley-Terry ratings of a set of players fitted to the results of their
+    games, on the Elo scale: a player rated d points above another scores
+    1 / (1 + 10^(-d/400)) against it. Draws count as half a win for both.
+
+    Ratings are relative to the mean of all players. Their covariance is the
+    inverse of the Fisher information of the fit, so confidence intervals
+    shrink with the number of games a player has against close opponents.
+    """
+
+    def __init__(self, players, stats, priorStd=1000, iterations=100, tolerance=1e-9):
+        """
+        Input:
+            players: names of the players to rate
+            stats: dict from pairs (p1, p2) to (p1 wins, p2 wins, draws), as
+                   returned by ResultStore.stats. Pairs with other players are
+                   ignored.
+            priorStd: std in Elo of a weak normal prior on every rating, which
+                      keeps ratings finite for players that won or lost all of
+                      their games and rates players without games at 0
+        """
+        self.players = list(players)
+        self.index = {p: i for i, p in enumerate(self.players)}
+        n = len(self.players)
+        self.games = np.zeros((n, n))  # games[i, j]: games between players i and j
+        self.scores = np.zeros((n, n))  # scores[i, j]: points player i scored against j
+        for (p1, p2), (p1Wins, p2Wins, draws) in stats.items():
+            if p1 not in self.index or p2 not in self.index or p1 == p2:
+                continue
+            i, j = self.index[p1], self.index[p2]
+            total = p1Wins + p2Wins + draws
+            self.games[i, j] += total
+            self.games[j, i] += total
+            self.scores[i, j] += p1Wins + draws / 2
+            self.scores[j, i] += p2Wins + draws / 2
+        self.precision = (ELO / priorStd) ** 2
+        self.fit(iterations, tolerance)
+
+    def fit(self, iterations, tolerance):
+        # Newton's method on the log-posterior, which is concave
+        n = len(self.players)
+        theta = np.zeros(n)
+        for _ in range(iterations):
+            p = 1 / (1 + np.exp(theta[None, :] - theta[:, None]))  # p[i, j]: expected score of i against j
+            gradient = (self.scores - self.games * p).sum(1) - self.precision * theta
+            information = self.information(p)
+            step = np.linalg.solve(information, gradient)
+            theta += step
+            if np.abs(step).max() < tolerance:
+                break
+        p = 1 / (1 + np.exp(theta[None, :] - theta[:, None]))
+        self.theta = theta - theta.mean()
+        # the covariance of the ratings relative to their mean
+        center = np.eye(n) - 1 / n
+        self.covariance = center @ np.linalg.inv(self.information(p)) @ center
+
+    def information(self, p):
+        weights = self.games * p * p.T
+        return np.diag(weights.sum(1) + self.precision) - weights
+
+    @property
+    def elo(self):
+        return ELO * self.theta
+
+    def rating(self, player):
+        return ELO * self.theta[self.index[player]]
+
+    def std(self, player):
+        i = self.index[player]
+        return ELO * math.sqrt(self.covariance[i, i])
+
+    def interval(self, player, confidence=0.95):
+        """
+        Returns:
+            (low, high): the confidence interval of the rating of player
+        """
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        rating, std = self.rating(player), self.std(player)
+        return rating - z * std, rating + z * std
+
+    def maxIntervalWidth(self, confidence=0.95):
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        return 2 * z * ELO * math.sqrt(np.diag(self.covariance).max(initial=0))
+
+    def expectedScore(self, p1, p2):
+        return 1 / (1 + math.exp(self.theta[self.index[p2]] - self.theta[self.index[p1]]))
+
+    def ladder(self, confidence=0.95):
+        """
+        Returns:
+            a list of (player, rating, low, high, games) from the highest rating
+            to the lowest
+        """
+        ladder = [(p, self.rating(p), *self.interval(p, confidence), int(self.games[i].sum()))
+                  for i, p in enumerate(self.players)]
+        return sorted(ladder, key=lambda row: -row[1])
+
+    def choosePairs(self, numPairs, gamesPerPair):
+        """
+        Greedily chooses the numPairs pairs whose next gamesPerPair games are
+        expected to reduce the total variance of the ratings the most. A game
+        between i and j adds p (1 - p) of information along r_i - r_j, so
+        players that are close in rating and uncertain are preferred. After
+        every choice the covariance is updated as if the games were played, so
+        later choices go elsewhere.
+
+        Returns:
+            a list of pairs (p1, p2) of player names, the same pair may occur
+            more than once
+        """
+        n = len(self.players)
+        if n < 2:
+            return []
+        covariance = self.covariance.copy()
+        p = 1 / (1 + np.exp(self.theta[None, :] - self.theta[:, None]))
+        weights = gamesPerPair * p * p.T
+        rows, cols = np.triu_indices(n, 1)
+        pairs = []
+        for _ in range(numPairs):
+            # for d = e_i - e_j: d'Cd and |Cd|^2 of all pairs at once
+            variance = np.diag(covariance)
+            pairVariance = variance[:, None] + variance[None, :] - 2 * covariance
+            gram = covariance @ covariance
+            gramDiagonal = np.diag(gram)
+            pairGram = gramDiagonal[:, None] + gramDiagonal[None, :] - 2 * gram
+            gain = weights * pairGram / (1 + weights * pairVariance)
+            best = np.argmax(gain[rows, cols])
+            i, j = rows[best], cols[best]
+            pairs.append((self.players[i], self.players[j]))
+            d = covariance[:, i] - covariance[:, j]
+            covariance -= weights[i, j] * np.outer(d, d) / (1 + weights[i, j] * pairVariance[i, j])
+        return pairs
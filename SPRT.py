@@ -0,0 +1,53 @@
+import math
+
+
+class SPRT():
+    """
+    Sequential probability ratio test of the score p of a player in its
+    decisive games (draws carry no information and are ignored), of
+    H0: p = p0 against H1: p = p1, p0 < p1.
+
+    After every game, the log-likelihood ratio of the results so far is
+    compared with two bounds: H1 is accepted once it is above log((1-beta)/alpha),
+    H0 once it is below log(beta/(1-alpha)). A player with score p0 is then
+    accepted with probability at most alpha and one with score p1 is rejected
+    with probability at most beta, usually after far fewer games than a fixed
+    length match with the same error rates.
+    """
+
+    def __init__(self, p0, p1, alpha=0.05, beta=0.05):
+        assert 0 < p0 < p1 < 1, "SPRT needs 0 < p0 < p1 < 1"
+        self.p0 = p0
+        self.p1 = p1
+        self.alpha = alpha
+        self.beta = beta
+        self.winWeight = math.log(p1 / p0)
+        self.lossWeight = math.log((1 - p1) / (1 - p0))
+        self.upper = math.log((1 - beta) / alpha)
+        self.lower = math.log(beta / (1 - alpha))
+
+    @classmethod
+    def around(cls, threshold, margin, alpha=0.05, beta=0.05):
+        """
+        Returns a test of whether the score is above threshold, which does not
+        care about the outcome for scores within margin of it.
+        """
+        epsilon = 1e-3
+        p0 = min(max(threshold - margin, epsilon), 1 - 2 * epsilon)
+        p1 = min(max(threshold + margin, p0 + epsilon), 1 - epsilon)
+        return cls(p0, p1, alpha, beta)
+
+    def llr(self, wins, losses):
+        return wins * self.winWeight + losses * self.lossWeight
+
+    def test(self, wins, losses):
+        """
+        Returns:
+            1 if H1 is accepted, -1 if H0 is accepted, 0 if more games are needed
+        """
+        llr = self.llr(wins, losses)
+        if llr >= self.upper:
+            return 1
+        if llr <= self.lower:
+            return -1
+        return 0
@@ -0,0 +1,213 @@
+import concurrent.futures as conc
+import logging
+import multiprocessing as mp
+import os
+import sqlite3
+import time
+from itertools import combinations
+
+from Ratings import Ratings
+
+log = logging.getLogger(__name__)
+
+
+class ResultStore():
+    """
+    Append-only record of tournament games, kept in an SQLite database in WAL
+    mode so that any number of processes can add results at the same time
+    without blocking readers. Every batch of games is one row, the stats of a
+    pair are the sum of its rows. The database must be on a local disk, WAL
+    does not work on network file systems.
+    """
+
+    def __init__(self, path, timeout=60):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS results '
+                                    '(p1 TEXT, p2 TEXT, p1_wins INTEGER, p2_wins INTEGER, draws INTEGER, '
+                                    'worker TEXT, time REAL)')
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def record(self, p1, p2, p1Wins, p2Wins, draws, worker=''):
+        """
+        Adds the results of a batch of games between the players p1 and p2.
+        """
+        if p2 < p1:
+            p1, p2, p1Wins, p2Wins = p2, p1, p2Wins, p1Wins
+        with self.connection:
+            self.connection.execute('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                    (p1, p2, int(p1Wins), int(p2Wins), int(draws), worker, time.time()))
+
+    def stats(self):
+        """
+        Returns:
+            stats: dict from every pair (p1, p2) with p1 < p2 that played to
+                   (p1 wins, p2 wins, draws)
+        """
+        rows = self.connection.execute('SELECT p1, p2, SUM(p1_wins), SUM(p2_wins), SUM(draws) '
+                                       'FROM results GROUP BY p1, p2')
+        return {(p1, p2): (p1Wins, p2Wins, draws) for p1, p2, p1Wins, p2Wins, draws in rows}
+
+    def getStats(self, p1, p2):
+        """
+        Returns:
+            (p1 wins, p2 wins, draws) of all games between p1 and p2
+        """
+        if p2 < p1:
+            p2Wins, p1Wins, draws = self.getStats(p2, p1)
+            return p1Wins, p2Wins, draws
+        row = self.connection.execute('SELECT SUM(p1_wins), SUM(p2_wins), SUM(draws) FROM results '
+                                      'WHERE p1 = ? AND p2 = ?', (p1, p2)).fetchone()
+        return tuple(x or 0 for x in row)
+
+    def close(self):
+        self.connection.close()
+
+
+class Tournament():
+    """
+    Plays games between checkpoints on a local pool of processes and records
+    them in a ResultStore, either a full round robin or adaptively on the pairs
+    that tell the most about the ratings of the checkpoints.
+
+    Work is split into jobs of gamesPerJob games of one pair (an even number so
+    that both players start equally often). Every job adds its results to the
+    store as soon as it is done, so an interrupted tournament resumes where it
+    stopped: only the games a pair is still missing are scheduled again.
+    """
+
+    def __init__(self, players, storePath, game, args=None, netArgs=None, numWorkers=1, gamesPerJob=10,
+                 agentsPerJob=2):
+        """
+        Input:
+            players: dict from the name of every player to its checkpoint path
+            storePath: path of the SQLite database of the results
+            args: MCTS args of the agents, see ArenaParallel.Arena
+            netArgs: net_args the checkpoints were trained with
+            agentsPerJob: agents of each player a job plays in parallel threads
+        """
+        self.players = players
+        self.storePath = storePath
+        self.store = ResultStore(storePath)
+        self.game = game
+        self.args = args
+        self.netArgs = netArgs
+        self.numWorkers = numWorkers
+        self.gamesPerJob = gamesPerJob
+        self.agentsPerJob = agentsPerJob
+
+    def remaining(self, gamesPerPair):
+        """
+        Returns:
+            remaining: dict from every pair (p1, p2) with p1 < p2 that has
+                       fewer than gamesPerPair games to the number of games it
+                       is missing
+        """
+        stats = self.store.stats()
+        remaining = {}
+        for pair in combinations(sorted(self.players), 2):
+            missing = gamesPerPair - sum(stats.get(pair, (0, 0, 0)))
+            if missing > 0:
+                remaining[pair] = missing
+        return remaining
+
+    def roundRobin(self, gamesPerPair=100):
+        """
+        Plays until every pair of players has at least gamesPerPair games.
+        Pairs that already have them are skipped.
+
+        Returns:
+            stats: ResultStore.stats of all games
+        """
+        remaining = self.remaining(gamesPerPair)
+        jobs = []
+        # interleave the pairs so that all of them make progress together
+        while remaining:
+            for pair in list(remaining):
+                games = min(self.gamesPerJob, remaining[pair])
+                games += games % 2  # keep the colours balanced
+                jobs.append((*pair, games))
+                remaining[pair] -= games
+                if remaining[pair] <= 0:
+                    del remaining[pair]
+        self.play(jobs)
+        return self.store.stats()
+
+    def ratings(self):
+        return Ratings(self.players, self.store.stats())
+
+    def adaptive(self, maxGames, targetWidth=100, confidence=0.95, jobsPerRound=None):
+        """
+        Plays rounds of jobs on the pairs Ratings.choosePairs expects to tell
+        the most about the ratings, until the widest confidence interval of a
+        rating is at most targetWidth Elo or maxGames games were played. Games
+        already in the store count towards the intervals but not towards
+        maxGames.
+
+        Returns:
+            ratings: the Ratings of the players after the last round
+        """
+        jobsPerRound = jobsPerRound or 2 * self.numWorkers
+        played = 0
+        with self.pool() as executor:
+            while True:
+                ratings = Ratings(self.players, self.store.stats())
+                width = ratings.maxIntervalWidth(confidence)
+                log.info(f'{played} games played, widest {confidence:.0%} interval {width:.0f} Elo')
+                if width <= targetWidth or played >= maxGames:
+                    return ratings
+                games = self.gamesPerJob + self.gamesPerJob % 2
+                jobs = [(*pair, games) for pair in ratings.choosePairs(jobsPerRound, games)]
+                self.play(jobs, executor)
+                played += games * len(jobs)
+
+    def pool(self):
+        return conc.ProcessPoolExecutor(self.numWorkers, mp_context=mp.get_context('spawn'), initializer=initWorker)
+
+    def play(self, jobs, executor=None):
+        """
+        Plays the jobs, (p1, p2, number of games) tuples, on the process pool,
+        or on a new pool if executor is None.
+        """
+        if len(jobs) == 0:
+            return
+        if executor is None:
+            with self.pool() as executor:
+                return self.play(jobs, executor)
+        log.info(f'Playing {sum(games for _, _, games in jobs)} games in {len(jobs)} jobs '
+                 f'with {self.numWorkers} workers')
+        start = time.time()
+        futures = [executor.submit(playJob, self.players[p1], self.players[p2], p1, p2, games, self.storePath,
+                                   self.game, self.args, self.netArgs, self.agentsPerJob)
+                   for p1, p2, games in jobs]
+        for done, future in enumerate(conc.as_completed(futures), 1):
+            p1, p2, stats = future.result()
+            log.info(f'[{done}/{len(jobs)}] {p1} vs {p2}: {stats} ({time.time() - start:.0f}s)')
+
+
+def initWorker():
+    # the workers are the parallelism, one thread each for the networks
+    import torch
+    torch.set_num_threads(1)
+
+
+def playJob(p1Path, p2Path, p1, p2, numGames, storePath, game, args, netArgs, numAgents):
+    """
+    Plays numGames games between two checkpoints in a worker process of a
+    Tournament and records them in the store at storePath.
+
+    Returns:
+        (p1, p2, (p1 wins, p2 wins, draws))
+    """
+    from ArenaParallel import Arena
+
+    arena = Arena(p1Path, p2Path, numAgents, game, net_1_args=netArgs, net_2_args=netArgs, args=args, names=(p1, p2))
+    stats = arena.playGamesParallel(numGames)
+    store = ResultStore(storePath)
+    store.record(p1, p2, *stats, worker=str(os.getpid()))
+    store.close()
+    return p1, p2, tuple(int(x) for x in stats)
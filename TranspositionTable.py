@@ -0,0 +1,61 @@
+import threading
+from collections import OrderedDict
+
+
+class TranspositionTable():
+    """
+    A bounded cache of neural network evaluations that MCTS instances can
+    share, for example all the trees of the self-play episodes of an iteration.
+
+    Entries are keyed by the Zobrist hash of the symmetry class of a canonical
+    board (see Game.getZobristClass), so symmetric boards share one entry whose
+    policy is stored for the representative of the class. Entries remember the
+    version of the weights that produced them (NeuralNet.version). A lookup
+    with a different version is a miss, so entries are invalidated as soon as
+    the weights change. When the table is full the least recently used entry
+    is replaced.
+    """
+
+    def __init__(self, maxSize=2 ** 18):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()  # hash -> (version, pi, v)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, version):
+        """
+        Returns:
+            (pi, v): the stored evaluation of the board with hash key, or None
+                     if there is none for this version of the weights
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key, version, pi, v):
+        with self.lock:
+            self.entries[key] = (version, pi, v)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.
+
+    def resetStats(self):
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from time import perf_counter, time
+
+import numpy as np
+
+from MCTS import MCTS
+from NeuralNet import NeuralNet
+from gomaku.GomakuGame import GomakuGame
+from utils import *
+
+"""
+use this script to time the Gomoku engine on the cpu: the GomakuGame
+primitives on a fixed corpus of boards, MCTS.getActionProb at several numbers
+of simulations, NNetWrapper.predict and predict_batch for several network
+sizes and a whole self-play episode. Everything is seeded, so two runs time
+the same work. e.g.
+
+python benchmark.py --output baseline.json
+python benchmark.py --baseline baseline.json      # exits with 1 if something got slower
+
+Timings are the best of --repeats runs, in seconds per call.
+"""
+
+MCTS_SIMS = (25, 100, 400)
+NNET_SIZES = ((64, 2), (128, 4), (512, 6))  # (num_channels, res_blocks)
+BATCH_SIZE = 64
+
+
+class UniformNet(NeuralNet):
+    """
+    Evaluator that returns a uniform policy and a value of 0 for every board so
+    that a benchmark measures the search and not the network.
+    """
+
+    def __init__(self, game):
+        self.action_size = game.getActionSize()
+
+    def predict(self, board):
+        return np.full(self.action_size, 1 / self.action_size, dtype=np.float32), np.zeros(1, dtype=np.float32)
+
+
+def board_corpus(game, num_boards, seed=0):
+    """
+    Returns num_boards (canonical board, valid action, last action) tuples
+    from random games, at every stage of the game.
+    """
+    # getInitBoard plays its random opening moves with the global generator
+    np.random.seed(seed)
+    rng = np.random.RandomState(seed)
+    corpus = []
+    while len(corpus) < num_boards:
+        board = game.getInitBoard()
+        action = None
+        while game.getGameEnded(board, 1) == 0 and len(corpus) < num_boards:
+            nextAction = rng.choice(np.flatnonzero(game.getValidMoves(board, 1)))
+            corpus.append((board, nextAction, action))
+            board, player = game.getNextState(board, 1, nextAction)
+            board = game.getCanonicalForm(board, player)
+            action = nextAction
+    return corpus
+
+
+def time_calls(function, inputs, repeats):
+    """
+    Returns the best over repeats passes of the mean seconds per call of
+    function over inputs.
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        start = perf_counter()
+        for x in inputs:
+            function(x)
+        best = min(best, (perf_counter() - start) / len(inputs))
+    return best
+
+
+def uncached(game, function):
+    """
+    Returns function with the outcome cache of game cleared before every call,
+    so that the outcome is computed and not looked up.
+    """
+    def call(x):
+        game.outcomes.clear()
+        return function(x)
+    return call
+
+
+def benchmark_game(game, corpus, repeats):
+    pi = np.full(game.getActionSize(), 1 / game.getActionSize())
+    calls = {
+        'getNextState': lambda x: game.getNextState(x[0], 1, x[1]),
+        'getValidMoves': lambda x: game.getValidMoves(x[0], 1),
+        'getGameEnded': uncached(game, lambda x: game.getGameEnded(x[0], 1)),
+        'getCanonicalForm': lambda x: game.getCanonicalForm(x[0], -1),
+        'getSymmetries': lambda x: game.getSymmetries(x[0], pi),
+        'stringRepresentation': lambda x: game.stringRepresentation(x[0]),
+        'stateKey': lambda x: game.stateKey(x[0]),
+        'findWinner': lambda x: game.findWinner(x[0]),
+    }
+    results = {f'game.{name}': {'seconds': time_calls(call, corpus, repeats)} for name, call in calls.items()}
+    # the stone of the last action is the opponent's on a canonical board
+    played = [(x[0], x[2]) for x in corpus if x[2] is not None]
+    results['game.findWinnerThrough'] = {
+        'seconds': time_calls(lambda x: game.findWinnerThrough(-x[0], x[1]), played, repeats)}
+
+    # the same work on the bitboards that MCTS keeps in its rows
+    bitboards = [(game.toBitboard(x[0]), x[1], x[2]) for x in corpus]
+    calls = {
+        'toBitboard': lambda x: game.toBitboard(x[0]),
+        'fromBitboard': lambda x: game.fromBitboard(x[0]),
+        'getNextBitboard': lambda x: game.getNextBitboard(x[0], x[1]),
+        'getBitboardValidMoves': lambda x: game.getBitboardValidMoves(x[0]),
+        'getBitboardGameEnded': lambda x: game.getBitboardGameEnded(x[0]),
+    }
+    for name, call in calls.items():
+        inputs = corpus if name == 'toBitboard' else bitboards
+        results[f'game.{name}'] = {'seconds': time_calls(call, inputs, repeats)}
+    played = [x for x in bitboards if x[2] is not None]
+    results['game.getBitboardGameEnded[action]'] = {
+        'seconds': time_calls(lambda x: game.getBitboardGameEnded(x[0], x[2]), played, repeats)}
+    return results
+
+
+def benchmark_search(game, corpus, repeats, sims_list=MCTS_SIMS):
+    """
+    Times getActionProb from fresh trees on every 4th board of the corpus with
+    a uniform evaluator, so only the search itself is timed.
+    """
+    results = {}
+    net = UniformNet(game)
+    boards = corpus[::4]
+    for sims in sims_list:
+        args = dotdict({'numMCTSSims': sims, 'cpuct': 1.0})
+
+        def search(x):
+            np.random.seed(0)
+            MCTS(game, net, args).getActionProb(x[0], temp=1)
+        seconds = time_calls(search, boards, repeats)
+        results[f'mcts.getActionProb[sims={sims}]'] = {'seconds': seconds, 'simulationsPerSecond': sims / seconds}
+    return results
+
+
+def make_net(game, num_channels, res_blocks):
+    import torch
+    from gomaku.pytorch.NNet import NNetWrapper, args as default_args
+
+    torch.manual_seed(0)
+    return NNetWrapper(game, dotdict({**default_args, 'num_channels': num_channels, 'res_blocks': res_blocks,
+                                      'cuda': False}))
+
+
+def benchmark_nnet(game, corpus, repeats, sizes=NNET_SIZES, batch_size=BATCH_SIZE):
+    results = {}
+    boards = [x[0] for x in corpus]
+    for num_channels, res_blocks in sizes:
+        nnet = make_net(game, num_channels, res_blocks)
+        size = f'{num_channels}x{res_blocks}'
+        nnet.predict(boards[0])  # warm up
+        results[f'nnet.predict[{size}]'] = {'seconds': time_calls(nnet.predict, boards[:64], repeats)}
+        batches = [np.array(boards[i:i + batch_size]) for i in range(0, len(boards) - batch_size + 1, batch_size)]
+        seconds = time_calls(nnet.predict_batch, batches[:4], repeats)
+        results[f'nnet.predict_batch[{size},batch={batch_size}]'] = {'seconds': seconds,
+                                                                     'boardsPerSecond': batch_size / seconds}
+    return results
+
+
+def benchmark_selfplay(game, repeats, sims=25, size=(64, 2)):
+    """
+    Times Coach.executeEpisode with a small network, per move so that a
+    change in the length of the seeded game does not count as a regression.
+    """
+    import random
+    import torch
+    from Coach import SelfPlayWorker
+
+    nnet = make_net(game, *size)
+    args = dotdict({'numMCTSSims': sims, 'cpuct': 1.0, 'tempThreshold': 15})
+    worker = SelfPlayWorker(game, nnet, args)
+    best = float('inf')
+    for _ in range(repeats):
+        random.seed(0)
+        np.random.seed(0)
+        torch.manual_seed(0)
+        start = perf_counter()
+        examples, _ = worker.executeEpisode(MCTS(game, nnet, args))
+        seconds = perf_counter() - start
+        if seconds / len(examples) < best:
+            best, moves = seconds / len(examples), len(examples)
+    return {f'selfplay.episode[sims={sims},{size[0]}x{size[1]}]': {'seconds': best, 'moves': moves}}
+
+
+def environment():
+    """
+    Returns what the timings depend on besides the code.
+    """
+    import torch
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {'time': time(), 'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'torch': torch.__version__, 'machine': platform.machine(), 'processor': platform.processor(),
+            'cpus': os.cpu_count(), 'threads': torch.get_num_threads()}
+
+
+def run(groups, repeats, quick=False):
+    """
+    Returns the results of the benchmark groups ('game', 'mcts', 'nnet',
+    'selfplay') as a dict from benchmark name to its timings.
+    """
+    game = GomakuGame(8)
+    corpus = board_corpus(game, 256)
+    results = {}
+    if 'game' in groups:
+        results.update(benchmark_game(game, corpus, repeats))
+    if 'mcts' in groups:
+        results.update(benchmark_search(game, corpus, repeats, MCTS_SIMS[:2] if quick else MCTS_SIMS))
+    if 'nnet' in groups:
+        results.update(benchmark_nnet(game, corpus, repeats, NNET_SIZES[:2] if quick else NNET_SIZES))
+    if 'selfplay' in groups:
+        results.update(benchmark_selfplay(game, repeats))
+    return results
+
+
+def compare(baseline, results, threshold):
+    """
+    Returns the benchmarks of results that take more than (1 + threshold)
+    times their time in baseline, as (name, baseline seconds, seconds) tuples.
+    """
+    regressions = []
+    for name, timing in results.items():
+        if name in baseline and timing['seconds'] > (1 + threshold) * baseline[name]['seconds']:
+            regressions.append((name, baseline[name]['seconds'], timing['seconds']))
+    return regressions
+
+
+def format_seconds(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:.3g} {unit}'
+    return f'{seconds / 1e-9:.3g} ns'
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the Gomoku engine")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown that counts as a regression")
+    parser.add_argument("--groups", default="game,mcts,nnet,selfplay", help="comma separated benchmark groups")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=1, help="torch threads")
+    parser.add_argument("--quick", action="store_true", help="skip the largest search and network")
+    cli = parser.parse_args()
+
+    import torch
+    torch.set_num_threads(cli.threads)
+    results = run(cli.groups.split(','), cli.repeats, cli.quick)
+    baseline = None
+    if cli.baseline:
+        with open(cli.baseline) as f:
+            baseline = json.load(f)['results']
+    for name, timing in results.items():
+        line = f'{name:55s} {format_seconds(timing["seconds"]):>10s}'
+        if baseline is not None and name in baseline:
+            line += f'  {timing["seconds"] / baseline[name]["seconds"]:6.2f}x baseline'
+        print(line)
+    if cli.output:
+        with open(cli.output, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+    if baseline is not None:
+        regressions = compare(baseline, results, cli.threshold)
+        for name, before, after in regressions:
+            print(f'REGRESSION {name}: {format_seconds(before)} -> {format_seconds(after)}')
+        sys.exit(1 if regressions else 0)
@@ -1,8 +1,8 @@
+import os
 from typing import List
 
-from MCTS import MCTS
+from MCTS import MCTS, MCTSPlayer
 from gomaku.GomakuGame import GomakuGame
-from gomaku.pytorch.NNet import NNetWrapper as NNet
 from utils import *
 
 import numpy as np
@@ -15,17 +15,36 @@ inverse_content = {
 
 game = GomakuGame(8)
 
+
+def load_net(checkpoint, net_args=None):
+    """
+    Returns the network of checkpoint. .onnx files are evaluated with
+    onnxruntime, which starts faster and does not import torch, anything else
+    with pytorch. A pytorch network is left untrained if checkpoint does not
+    exist.
+    """
+    if checkpoint.endswith('.onnx'):
+        from gomaku.onnxrt.NNet import NNetWrapper as NNet
+    else:
+        from gomaku.pytorch.NNet import NNetWrapper as NNet
+    net = NNet(game, net_args)
+    if os.path.isfile(checkpoint) or checkpoint.endswith('.onnx'):
+        # a checkpoint, or the .pt or .onnx file exported from it
+        net.load_checkpoint(*os.path.split(checkpoint))
+    return net
+
 class CompetitionPlayer:
-    def __init__(self, net_args: dotdict, checkpoint="./checkpoints/best.pth.tar", iterations: int=50):
+    def __init__(self, net_args: dotdict, checkpoint="./checkpoints/best.pth.tar", iterations: int=50, reuse_tree=False):
         self.checkpoint = checkpoint
         self.size = game.getBoardSize()[0]
-        self.mcts_args = dotdict({'numMCTSSims': iterations, 'cpuct': 1.0})
+        self.mcts_args = dotdict({'numMCTSSims': iterations, 'cpuct': 1.0, 'reuseTree': reuse_tree})
         self.net_args = net_args
-        self.net = NNet(game, self.net_args)
+        self.net = load_net(checkpoint, self.net_args)
         self.mcts = MCTS(game, self.net, self.mcts_args)
+        self.player = MCTSPlayer(self.mcts)  # finds the opponent's last move for the feature planes
 
     def from_string_array(self, board_seed):
-        board = np.zeros((self.size, self.size))
+        board = np.zeros((self.size, self.size), dtype=game.boardDtype)
         for y in range(self.size):
             for x in range(self.size):
                 val = inverse_content[board_seed[y][x]]
@@ -44,7 +63,8 @@ class CompetitionPlayer:
         board = self.from_string_array(board)
 
         canonical_board = game.getCanonicalForm(board, player)
-        action_probs = self.mcts.getActionProb(canonical_board, temp=0)
+        last_action = self.player.getLastAction(canonical_board)
+        action_probs = self.mcts.getActionProb(canonical_board, temp=0, lastAction=last_action)
         action = np.argmax(action_probs)
         valid_actions = game.getValidMoves(canonical_board, 1)
 
@@ -53,21 +73,26 @@ class CompetitionPlayer:
             # Mask the probs with the valid actions and select from that.
             valid_action_probs = action_probs*valid_actions
             action = np.argmax(valid_action_probs)
+        self.player.played(canonical_board, action)
 
+        if self.mcts.args.reuseTree:
+            # keep the subtree of our move, the opponent's reply is found in it on the next move
+            self.mcts.advance(action)
         return self.action_to_yx(action)
 
 
 class Player:
-    def __init__(self, checkpoint = "./checkpoints/best.pth.tar", iterations=50):
+    def __init__(self, checkpoint = "./checkpoints/best.pth.tar", iterations=50, reuse_tree=False):
         self.checkpoint = checkpoint
         self.size = 8
-        self.net = NNet(game)
-        self.args = dotdict({'numMCTSSims': iterations, 'cpuct': 1.0})
+        self.net = load_net(checkpoint)
+        self.args = dotdict({'numMCTSSims': iterations, 'cpuct': 1.0, 'reuseTree': reuse_tree})
         self.mcts = MCTS(game, self.net, self.args)
+        self.player = MCTSPlayer(self.mcts)  # finds the opponent's last move for the feature planes
 
     def from_string_array(self, board_seed: List[List[str]]):
         # This is the format the game will be delivered in in the competition
-        board = np.zeros((self.size, self.size))
+        board = np.zeros((self.size, self.size), dtype=game.boardDtype)
         for y in range(self.size):
             for x in range(self.size):
                 val = inverse_content[board_seed[y][x]]
@@ -87,7 +112,8 @@ class Player:
             board = self.from_string_array(board)
 
         canonical_board = game.getCanonicalForm(board, player)
-        action_probs = self.mcts.getActionProb(canonical_board, temp=0)
+        last_action = self.player.getLastAction(canonical_board)
+        action_probs = self.mcts.getActionProb(canonical_board, temp=0, lastAction=last_action)
         action = np.argmax(action_probs)
         valid_actions = game.getValidMoves(canonical_board, 1)
 
@@ -96,5 +122,9 @@ class Player:
             # Mask the probs with the valid actions and select from that.
             valid_action_probs = action_probs*valid_actions
             action = np.argmax(valid_action_probs)
+        self.player.played(canonical_board, action)
 
+        if self.mcts.args.reuseTree:
+            # keep the subtree of our move, the opponent's reply is found in it on the next move
+            self.mcts.advance(action)
         return self.action_to_yx(action)
@@ -1,7 +1,9 @@
 import sys
+import threading
+from collections import OrderedDict
 sys.path.append('..')
 from Game import Game
-# from .OthelloLogic import Board
+from .GomakuLogic import Board, exactFives, fromCells
 import numpy as np
 
 class GomakuGame(Game):
@@ -17,9 +19,67 @@ class GomakuGame(Game):
         "w": 1
     }
 
-    def __init__(self, n):
+    directions = [(0, 1), (1, 0), (1, 1), (1, -1)]  # the four lines through a stone
+
+    outcomeCacheSize = 4096
+
+    zobristSeed = 190  # fixed so that every process hashes boards the same way
+
+    boardDtype = np.int8  # boards only hold 1, -1 and 0
+
+    def __init__(self, n, featurePlanes=False, threatPlanes=False):
+        """
+        Input:
+            featurePlanes: feed the network stacked planes (own stones, opponent
+                           stones, empty cells, last move) instead of the board,
+                           see getFeaturePlanes
+            threatPlanes: add two planes with the cells that complete five for
+                          either player to the feature planes
+        """
         super(Game, self).__init__()
         self.size = n
+        self.featurePlanes = featurePlanes or threatPlanes
+        self.threatPlanes = threatPlanes
+        self.outcomes = OrderedDict()  # stateKey(board) -> winning colour, draw value or 0
+        self.outcomesLock = threading.Lock()  # the self-play threads of a process share the game
+
+        # Flat indices of every line of 7 cells whose 5 middle cells are on the
+        # board. Cells outside of the board point to an extra empty cell n*n.
+        windows = []
+        for d_y, d_x in self.directions:
+            for y in range(n):
+                for x in range(n):
+                    line = [(y + k * d_y, x + k * d_x) for k in range(-1, 6)]
+                    if all(0 <= cur_y < n and 0 <= cur_x < n for cur_y, cur_x in line[1:6]):
+                        windows.append([cur_y * n + cur_x if 0 <= cur_y < n and 0 <= cur_x < n else n * n
+                                        for cur_y, cur_x in line])
+        self.windows = np.array(windows)
+
+        # symmetries[t] maps a flat board to its t-th symmetry in the order of
+        # getSymmetries: symmetric_board.ravel() == board.ravel()[symmetries[t]]
+        cells = np.arange(n * n).reshape(n, n)
+        self.symmetries = np.array([b.ravel() for b, _ in self.getSymmetries(cells, cells.ravel())])
+        self.inverseSymmetries = np.argsort(self.symmetries, axis=1)
+
+        # zobrist[0, t, a] and zobrist[1, t, a] are the keys of a stone of colour 1 and -1
+        # on cell a of a board, as seen on the t-th symmetry of that board
+        rng = np.random.default_rng(self.zobristSeed)
+        zobrist = rng.integers(0, np.iinfo(np.uint64).max, size=(2, n * n), dtype=np.uint64, endpoint=True)
+        self.zobrist = zobrist[:, self.inverseSymmetries]
+        # lastMoveZobrist[t, a]: the same for the last move being played on cell a
+        lastMove = rng.integers(0, np.iinfo(np.uint64).max, size=n * n, dtype=np.uint64, endpoint=True)
+        self.lastMoveZobrist = lastMove[self.inverseSymmetries]
+
+    def __getstate__(self):
+        # the outcome cache is not worth sending to worker processes, and a lock cannot be pickled
+        state = self.__dict__.copy()
+        del state['outcomes'], state['outcomesLock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.outcomes = OrderedDict()
+        self.outcomesLock = threading.Lock()
 
     def getInitBoard(self, play_random_moves=2):
         """
@@ -30,7 +90,7 @@ class GomakuGame(Game):
             startBoard: a representation of the board (ideally this is the form
                         that will be the input to your neural network)
         """
-        board = np.zeros((self.size, self.size))
+        board = np.zeros((self.size, self.size), dtype=self.boardDtype)
         if play_random_moves > 0:
             moves = np.random.choice(self.size**2, play_random_moves*2, replace=False)
             for i, action in enumerate(moves):
@@ -79,11 +139,7 @@ class GomakuGame(Game):
                         moves that are valid from the current board and player,
                         0 for invalid moves
         """
-        zeros = np.where(board == 0)
-        valid_moves = zeros[0] * self.size + zeros[1]
-        all_moves = np.zeros(self.getActionSize(), dtype=int)
-        all_moves[valid_moves] = 1
-        return all_moves
+        return (board == 0).astype(int).ravel()
 
     def getGameEnded(self, board, player):
         """
@@ -96,59 +152,71 @@ class GomakuGame(Game):
                small non-zero value for draw.
 
         """
+        key = self.stateKey(board)
+        outcome = self.outcomes.get(key)
+        if outcome is None:
+            winner = self.findWinner(board)
+            outcome = self.cacheOutcome(key, winner if winner != 0 else self.getDrawOutcome(board))
+        return player * outcome if abs(outcome) == 1 else outcome
 
-        # Returns -1 is black won and 1 if white won. 0 if there was a draw. None if the game is ongoing.
-        # TODO: Check if there is a valid 5 in a row
-        def detect_five(y_start, x_start, d_y, d_x):
-            seq_length = None
-            seq_player = None
-            y_max = self.size - 1
-            x_max = self.size - 1
-            while 0 <= y_start <= y_max and 0 <= x_start <= x_max:
-                cur_player = board[y_start, x_start]
-                if cur_player == seq_player:
-                    seq_length += 1
-                else:
-                    if seq_length == 5:
-                        return seq_player
-                    seq_length = None
-                    seq_player = None
-                    if cur_player != 0:
-                        seq_length = 1
-                        seq_player = cur_player
-                y_start += d_y
-                x_start += d_x
-            if seq_length == 5:
-                return seq_player
-            return None
+    def getGameEndedAfterMove(self, board, player, action):
+        """
+        Same as getGameEnded for a board on which action was the last move
+        played. Only the four lines through the last stone are checked, since
+        no other line can have changed.
+
+        Input:
+            board: board after action was played
+            player: player to report the result for (1 or -1)
+            action: last action played on board
+
+        Returns:
+            r: 0 if game has not ended. 1 if player won, -1 if player lost,
+               small non-zero value for draw.
+        """
+        key = self.stateKey(board)
+        outcome = self.outcomes.get(key)
+        if outcome is None:
+            winner = self.findWinnerThrough(board, action)
+            outcome = self.cacheOutcome(key, winner if winner != 0 else self.getDrawOutcome(board))
+        return player * outcome if abs(outcome) == 1 else outcome
+
+    def findWinner(self, board):
+        """
+        Returns:
+            winner: the colour (1 or -1) that has exactly five stones in a row
+                    anywhere on board, 0 if neither has
+        """
+        return Board.fromArray(board).winner()
 
-        # Check for a winner
-        winner = None
-        x_start = 0
-        for y_start in range(len(board)):
-            # Check directions (0, 1) and (1, 1)
-            winner = winner or detect_five(y_start, x_start, 0, 1)
-            winner = winner or detect_five(y_start, x_start, 1, 1)
-        x_start = len(board[0]) - 1
-        for y_start in range(len(board)):
-            # Check direction (1, -1)
-            winner = winner or detect_five(y_start, x_start, 1, -1)
-        y_start = 0
-        for x_start in range(len(board[0])):
-            # Check direction (1, 0)
-            winner = winner or detect_five(y_start, x_start, 1, 0)
-            if x_start > 0:
-                # Check the rows that were not on the y pass
-                winner = winner or detect_five(y_start, x_start, 1, 1)
-            if x_start < len(board[0]) - 1:
-                # Chck the rows that were not on the second y pass
-                winner = winner or detect_five(y_start, x_start, 1, -1)
-        if winner is not None:
-            return player*winner  # TODO: Make sure this actually verifies the winner
-
-        if np.max(self.getValidMoves(board, -player)) > 0:
+    def findWinnerThrough(self, board, action):
+        """
+        Returns:
+            winner: the colour of the stone placed by action if it is part of
+                    exactly five stones in a row, 0 otherwise
+        """
+        colour = board.flat[action]
+        if colour == 0:
             return 0
-        return 0.01
+        return int(colour) if exactFives(fromCells(board.ravel() == colour), self.size, action) else 0
+
+    def getDrawOutcome(self, board):
+        """
+        Returns 0.01 if no move is left on a board without a winner, 0 otherwise.
+        """
+        return 0 if (board == 0).any() else 0.01
+
+    def cacheOutcome(self, key, outcome):
+        """
+        Remembers the outcome of the board with the given key, dropping the
+        oldest entry once outcomeCacheSize outcomes are stored. Safe to call
+        from several threads.
+        """
+        with self.outcomesLock:
+            if len(self.outcomes) >= self.outcomeCacheSize:
+                self.outcomes.popitem(last=False)
+            self.outcomes[key] = outcome
+        return outcome
 
     def getCanonicalForm(self, board, player):
         """
@@ -183,22 +251,204 @@ class GomakuGame(Game):
         policy_board = np.reshape(pi, (self.size, self.size))
 
         for i in [0, 1, 2, 3]:  # For 0, 90, 180, and 270 degrees of rotation
-            rot_board = np.rot90(board, i)
+            rot_board = np.rot90(board, i, axes=(-2, -1))  # the last two axes, so that feature planes work too
             rot_policy_board = np.rot90(policy_board, i)
-            flipped_board = np.fliplr(rot_board)
+            flipped_board = np.flip(rot_board, -1)
             flipped_policy_board = np.fliplr(rot_policy_board)
             augmented_boards.extend(
                 [(rot_board, rot_policy_board.ravel()), (flipped_board, flipped_policy_board.ravel())])
         return augmented_boards
 
+    def toBitboard(self, board):
+        """
+        Input:
+            board: current board
+
+        Returns:
+            bitboard: GomakuLogic.Board of board, one integer per colour with
+                      bit a set for a stone on the cell of action a
+        """
+        return Board.fromArray(board)
+
+    def fromBitboard(self, bitboard):
+        """
+        Input:
+            bitboard: GomakuLogic.Board
+
+        Returns:
+            board: the board of bitboard in the format of getInitBoard
+        """
+        return bitboard.toArray(self.boardDtype)
+
+    def getNextBitboard(self, bitboard, action):
+        # the stone of player 1, then the colours swap for the next player
+        return bitboard.play(action).swap()
+
+    def getBitboardValidMoves(self, bitboard):
+        return bitboard.validMoves()
+
+    def getBitboardGameEnded(self, bitboard, action=None):
+        """
+        getGameEnded for player 1 of the board of bitboard. Only the lines
+        through action are checked if it is given. The outcomes are not
+        cached, the bitboard checks cost about as much as a cache lookup.
+        """
+        winner = bitboard.winner() if action is None else bitboard.winnerThrough(action)
+        if winner != 0:
+            return winner
+        return 0.01 if bitboard.isFull() else 0
+
+    def getSymmetryPermutations(self):
+        return self.symmetries
+
+    def getInputShape(self):
+        # known without building a board, getInitBoard would play random moves
+        if not self.featurePlanes:
+            return self.getBoardSize()
+        return 6 if self.threatPlanes else 4, self.size, self.size
+
+    def getFeaturePlanes(self, board, action=None):
+        """
+        Input:
+            board: canonical board
+            action: the last move played on board, if known
+
+        Returns:
+            planes: None if featurePlanes is off, otherwise an int8 array of
+                    shape (4, n, n), or (6, n, n) with threatPlanes, holding
+                    own stones, opponent stones, empty cells, the last move and
+                    the cells where the player to move or the opponent would
+                    complete five
+        """
+        if not self.featurePlanes:
+            return None
+        planes = np.zeros((6 if self.threatPlanes else 4, self.size, self.size), dtype=np.int8)
+        planes[0] = board == 1
+        planes[1] = board == -1
+        planes[2] = board == 0
+        if action is not None:
+            planes[3].flat[action] = 1
+        if self.threatPlanes:
+            planes[4:] = self.getThreatPlanes(board)
+        return planes
+
+    def getNextFeaturePlanes(self, planes, nextBoard, action):
+        """
+        Updates the planes of a canonical board for the stone placed by action.
+        The colours swap places because nextBoard is seen from the opponent.
+        Only the threat planes are computed from nextBoard again.
+        """
+        if planes is None:
+            return None
+        nextPlanes = np.empty_like(planes)
+        nextPlanes[0] = planes[1]
+        nextPlanes[1] = planes[0]
+        nextPlanes[1].flat[action] = 1
+        nextPlanes[2] = planes[2]
+        nextPlanes[2].flat[action] = 0
+        nextPlanes[3] = 0
+        nextPlanes[3].flat[action] = 1
+        if self.threatPlanes:
+            nextPlanes[4:] = self.getThreatPlanes(nextBoard)
+        return nextPlanes
+
+    def getThreatPlanes(self, board):
+        """
+        Returns:
+            threats: int8 array of shape (2, n, n), threats[0] marks the empty
+                     cells that complete exactly five stones of colour 1,
+                     threats[1] those of colour -1
+        """
+        threats = np.zeros((2, self.size * self.size + 1), dtype=np.int8)
+        cells = np.append(board.ravel(), 0)[self.windows]
+        sums = cells[:, 1:6].sum(axis=1)
+        for i, colour in enumerate((1, -1)):
+            # four stones of colour and one empty cell among the five middle cells
+            fours = (sums == 4 * colour) & (cells[:, 0] != colour) & (cells[:, 6] != colour)
+            middles = self.windows[fours, 1:6]
+            threats[i, middles[cells[fours, 1:6] == 0]] = 1
+        return threats[:, :-1].reshape(2, self.size, self.size)
+
+    def stateKey(self, board):
+        """
+        Input:
+            board: current board
+
+        Returns:
+            key: the raw bytes of the board as int8, one byte per cell
+        """
+        return board.astype(np.int8, copy=False).tobytes()
+
+    def getZobristKeys(self, board):
+        """
+        Input:
+            board: current board in its canonical form
+
+        Returns:
+            keys: np array of shape (2, 8). keys[0, t] is the Zobrist hash of
+                  the t-th symmetry of board, keys[1, t] the same hash for the
+                  board with the colours swapped.
+        """
+        cells = board.ravel()
+        own = np.bitwise_xor.reduce(self.zobrist[0][:, cells == 1], axis=1)
+        other = np.bitwise_xor.reduce(self.zobrist[1][:, cells == -1], axis=1)
+        own_swapped = np.bitwise_xor.reduce(self.zobrist[0][:, cells == -1], axis=1)
+        other_swapped = np.bitwise_xor.reduce(self.zobrist[1][:, cells == 1], axis=1)
+        return np.stack((own ^ other, own_swapped ^ other_swapped))
+
+    def getNextZobristKeys(self, keys, action):
+        """
+        Input:
+            keys: getZobristKeys of a canonical board
+            action: action taken by player 1 on that board
+
+        Returns:
+            nextKeys: getZobristKeys of the canonical board of the next player
+        """
+        # The next canonical board is -(board + stone of 1 on action). Its hash is
+        # the hash of -board with a stone of -1 added, and the other way around.
+        return keys[::-1] ^ self.zobrist[::-1, :, action]
+
+    def getZobristClass(self, keys, action=None):
+        """
+        Input:
+            keys: getZobristKeys of a board
+            action: the last move played on the board. It is mixed into the
+                    hash, since the last move plane of the feature planes makes
+                    it part of the network input.
+
+        Returns:
+            key: the smallest hash of the 8 symmetries of the board, which is
+                 the same for all boards that are symmetries of each other
+            symmetry: index of the symmetry with that hash
+        """
+        hashes = keys[0] if action is None else keys[0] ^ self.lastMoveZobrist[:, action]
+        symmetry = np.argmin(hashes)
+        return hashes[symmetry], symmetry
+
+    def applySymmetry(self, x, symmetry, inverse=False):
+        """
+        Input:
+            x: a board, feature planes, or a policy vector of size self.getActionSize()
+            symmetry: index of a symmetry in the order of getSymmetries
+            inverse: apply the inverse of the symmetry
+
+        Returns:
+            x transformed by the symmetry, with the shape of x
+        """
+        permutation = (self.inverseSymmetries if inverse else self.symmetries)[symmetry]
+        return np.reshape(np.reshape(x, (-1, self.size * self.size))[:, permutation], np.shape(x))
+
     def stringRepresentation(self, board, highlight_action=None, include_numbers=False):
         """
         Input:
             board: current board
+            highlight_action: action whose stone is printed in upper case
+            include_numbers: whether to print row and column numbers
 
         Returns:
-            boardString: a quick conversion of board to a string format.
-                         Required by MCTS for hashing.
+            boardString: a human readable conversion of board to a string
+                         format, used to display and log boards.
         """
         action_y = -1 if highlight_action is None else highlight_action // self.size
         action_x = -1 if highlight_action is None else highlight_action % self.size
@@ -215,7 +465,7 @@ class GomakuGame(Game):
 
     def from_string(self, board_seed: str):
         # This is the format that game.to_string returns
-        board = np.zeros((self.size, self.size))
+        board = np.zeros((self.size, self.size), dtype=self.boardDtype)
         lines = board_seed.split("\n")
         for y in range(len(lines)):
             for x in range(len(lines[0])):
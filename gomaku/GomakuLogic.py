@@ -0,0 +1,200 @@
+from functools import lru_cache
+
+import numpy as np
+
+"""
+Bitboard core of Gomoku. A position is two Python ints, one per colour, with
+bit y * n + x set for a stone on cell (y, x), so the index of a bit is the
+action that plays on its cell. An 8x8 board fits in two 64-bit words.
+"""
+
+
+@lru_cache(maxsize=None)
+def lineMasks(n):
+    """
+    Returns:
+        lines: one (shift, ahead, behind) tuple per direction of a line (right,
+               down, down-right and down-left). shift is the distance between
+               the bits of neighbouring cells on the line, ahead[k] the cells
+               whose k-th next cell on the line is on the board, for k up to 5,
+               and behind the cells whose previous cell is on the board. The
+               masks stop runs from wrapping around the edges of the board when
+               the bits are shifted.
+    """
+    lines = []
+    for d_y, d_x in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        ahead = [0] * 6
+        behind = 0
+        for y in range(n):
+            for x in range(n):
+                for k in range(6):
+                    if 0 <= y + k * d_y < n and 0 <= x + k * d_x < n:
+                        ahead[k] |= 1 << (y * n + x)
+                if 0 <= y - d_y < n and 0 <= x - d_x < n:
+                    behind |= 1 << (y * n + x)
+        lines.append((d_y * n + d_x, tuple(ahead), behind))
+    return tuple(lines)
+
+
+def exactFives(stones, n, through=None):
+    """
+    Input:
+        stones: bitboard of the stones of one colour
+        n: size of the board
+        through: only count lines that contain the cell of this action
+
+    Returns:
+        found: whether stones has exactly five in a row in any direction. Six
+               or more in a row do not count.
+    """
+    for shift, ahead, behind in lineMasks(n):
+        # cells that start two, then four, then five stones in a row
+        run = stones & (stones >> shift) & ahead[1]
+        run &= (run >> 2 * shift) & ahead[2]
+        run &= (stones >> 4 * shift) & ahead[4]
+        if run:
+            run &= ~((stones << shift) & behind) & ~((stones >> 5 * shift) & ahead[5])
+            if through is not None:
+                # the cells of the lines that start in run
+                run |= run << shift
+                run |= run << 2 * shift
+                run |= run << shift
+                run &= 1 << int(through)
+            if run:
+                return True
+    return False
+
+
+def toCells(n, *bitboards):
+    """
+    Returns:
+        cells: uint8 array of shape (len(bitboards), n * n), 1 for the cells
+               set in each bitboard
+    """
+    size = (n * n + 7) // 8  # bytes per bitboard
+    words = 0
+    for i, bits in enumerate(bitboards):
+        words |= bits << (8 * size * i)
+    data = np.frombuffer(words.to_bytes(size * len(bitboards), 'little'), dtype=np.uint8)
+    cells = np.unpackbits(data, bitorder='little').reshape(len(bitboards), 8 * size)
+    return cells if 8 * size == n * n else cells[:, :n * n]
+
+
+def fromCells(cells):
+    """
+    Returns:
+        bits: bitboard of the non-zero entries of the flat vector cells
+    """
+    return int.from_bytes(np.packbits(cells, bitorder='little').tobytes(), 'little')
+
+
+class Board():
+    """
+    Immutable Gomoku position as a pair of bitboards: own holds the stones of
+    colour 1, other those of colour -1. Playing a move returns a new Board.
+    """
+
+    __slots__ = ('n', 'own', 'other')
+
+    def __init__(self, n, own=0, other=0):
+        self.n = n
+        self.own = own
+        self.other = other
+
+    @classmethod
+    def fromArray(cls, board):
+        """
+        Input:
+            board: np array of shape (n, n) with 1, -1 and 0 for empty cells
+        """
+        n = board.shape[-1]
+        cells = board.ravel()
+        bits = fromCells(np.concatenate((cells == 1, cells == -1)))
+        return cls(n, bits & ((1 << (n * n)) - 1), bits >> (n * n))
+
+    def toArray(self, dtype=np.int8):
+        """
+        Returns:
+            board: np array of shape (n, n) with 1, -1 and 0 for empty cells
+        """
+        n = self.n
+        cells = toCells(n, self.own, self.other).view(np.int8)
+        return (cells[0] - cells[1]).reshape(n, n).astype(dtype, copy=False)
+
+    def toPlanes(self, dtype=np.int8):
+        """
+        Returns:
+            planes: np array of shape (3, n, n) with the stones of colour 1,
+                    the stones of colour -1 and the empty cells
+        """
+        n = self.n
+        return toCells(n, self.own, self.other, self.empty()).reshape(3, n, n).astype(dtype, copy=False)
+
+    def __eq__(self, other):
+        return isinstance(other, Board) and (self.n, self.own, self.other) == (other.n, other.own, other.other)
+
+    def __hash__(self):
+        return hash((self.n, self.own, self.other))
+
+    def __repr__(self):
+        return f'Board({self.n}, {self.own:#x}, {self.other:#x})'
+
+    def empty(self):
+        """
+        Returns:
+            mask: bitboard of the empty cells, the valid moves of either player
+        """
+        return ~(self.own | self.other) & ((1 << (self.n * self.n)) - 1)
+
+    def validMoves(self):
+        """
+        Returns:
+            validMoves: uint8 vector of length n * n, 1 for the empty cells
+        """
+        return toCells(self.n, self.empty())[0]
+
+    def play(self, action, player=1):
+        """
+        Returns:
+            board: a new board with a stone of player (1 or -1) on action
+        """
+        stone = 1 << int(action)
+        if player == 1:
+            return Board(self.n, self.own | stone, self.other)
+        return Board(self.n, self.own, self.other | stone)
+
+    def swap(self):
+        """
+        Returns:
+            board: the board with the colours swapped, the canonical form for
+                   the player of colour -1
+        """
+        return Board(self.n, self.other, self.own)
+
+    def winner(self):
+        """
+        Returns:
+            winner: the colour (1 or -1) that has exactly five stones in a row,
+                    0 if neither has
+        """
+        if exactFives(self.own, self.n):
+            return 1
+        if exactFives(self.other, self.n):
+            return -1
+        return 0
+
+    def winnerThrough(self, action):
+        """
+        Returns:
+            winner: the colour of the stone on action if it is part of exactly
+                    five stones in a row, 0 otherwise
+        """
+        stone = 1 << int(action)
+        if self.own & stone:
+            return 1 if exactFives(self.own, self.n, action) else 0
+        if self.other & stone:
+            return -1 if exactFives(self.other, self.n, action) else 0
+        return 0
+
+    def isFull(self):
+        return self.empty() == 0
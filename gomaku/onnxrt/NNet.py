@@ -0,0 +1,99 @@
+import hashlib
+import os
+import sys
+
+import numpy as np
+import onnxruntime as ort
+
+sys.path.append('../../')
+from utils import *
+from NeuralNet import NeuralNet
+
+args = dotdict({
+    'num_threads': 1,  # threads of onnxruntime for one evaluation, 0 lets onnxruntime decide
+})
+
+
+class NNetWrapper(NeuralNet):
+    """
+    Evaluates the residual Gomoku network with onnxruntime on the cpu. It is a
+    drop-in for the pytorch NNetWrapper wherever the network is only used for
+    inference (MCTS, ArenaParallel, connection.Player); it cannot be trained.
+
+    load_checkpoint takes a .onnx file, which does not need torch at all, or a
+    pytorch checkpoint, which is converted to folder/filename + '.onnx' first.
+    """
+
+    def __init__(self, game, net_args: dotdict = None):
+        self.game = game
+        self.net_args = net_args  # the architecture of pytorch checkpoints to convert, and num_threads
+        self.num_threads = (net_args or args).get('num_threads', args.num_threads)
+        self.board_x, self.board_y = game.getBoardSize()
+        self.action_size = game.getActionSize()
+        self.input_shape = game.getInputShape()
+        self.session = None
+        self.inputs = None  # float32 buffer the boards are copied into, see prepare
+
+    def train(self, examples):
+        raise NotImplementedError("The onnxruntime network can not be trained, train the pytorch network instead")
+
+    def predict(self, board):
+        """
+        board: np array with board
+        """
+        pi, v = self.session.run(None, {'board': self.prepare(board)})
+        return np.exp(pi[0]), v[0]
+
+    def predict_batch(self, boards):
+        """
+        boards: list or stacked np array of boards, evaluated in one run
+        """
+        pi, v = self.session.run(None, {'board': self.prepare(boards)})
+        return np.exp(pi), v.reshape(-1)
+
+    def prepare(self, boards):
+        """
+        Copies a board, or a list or stacked array of boards, into the float32
+        input buffer, which is reused across calls and only grows.
+
+        Returns:
+            inputs: the part of the buffer holding the boards
+        """
+        boards = np.asarray(boards).reshape(-1, *self.input_shape)
+        if self.inputs is None or len(self.inputs) < len(boards):
+            self.inputs = np.empty((len(boards), *self.input_shape), dtype=np.float32)
+        inputs = self.inputs[:len(boards)]
+        inputs[...] = boards
+        return inputs
+
+    def save_checkpoint(self, folder='checkpoint', filename='checkpoint.pth.tar'):
+        raise NotImplementedError("The onnxruntime network can not be saved, save the pytorch network instead")
+
+    def load_checkpoint(self, folder='checkpoint', filename='checkpoint.pth.tar'):
+        filepath = os.path.join(folder, filename)
+        if not os.path.exists(filepath):
+            raise Exception("No model in path {}".format(filepath))
+        if not filename.endswith('.onnx'):
+            filepath = self.convert_checkpoint(folder, filename)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.num_threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(filepath, options, providers=['CPUExecutionProvider'])
+        with open(filepath, 'rb') as f:
+            self.version = hashlib.sha1(f.read()).hexdigest()
+
+    def convert_checkpoint(self, folder, filename):
+        """
+        Exports the pytorch checkpoint folder/filename, built with net_args, to
+        folder/filename + '.onnx'.
+
+        Returns:
+            filepath: the path of the ONNX model
+        """
+        from ..pytorch.NNet import NNetWrapper as TorchNNetWrapper
+        from ..pytorch.ExportNNet import export_onnx
+
+        nnet = TorchNNetWrapper(self.game, self.net_args)
+        nnet.load_checkpoint(folder, filename)
+        return export_onnx(nnet.nnet, nnet.input_shape, os.path.join(folder, filename + '.onnx'))
@@ -0,0 +1,158 @@
+import argparse
+import os
+import sys
+import warnings
+from time import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.ao.quantization import fuse_modules, quantize_dynamic
+
+sys.path.append('../../')
+from utils import *
+
+"""
+use this script to export a checkpoint of the residual Gomoku network for
+inference, check the exported model against the checkpoint and time both, e.g.
+python -m gomaku.pytorch.ExportNNet ./temp/ best.pth.tar --quantize
+"""
+
+
+def fuse(net):
+    """
+    Returns a copy of the GomakuNet net in eval mode in which every BatchNorm2d
+    is folded into the Conv2d before it.
+    """
+    fused = type(net)(net.game, net.args)
+    fused.load_state_dict(net.state_dict())
+    fused.cpu().eval()
+    groups = [['input.conv', 'input.bn'], ['out.conv', 'out.bn'], ['out.conv1', 'out.bn1']]
+    for block in range(net.args.res_blocks):
+        groups += [[f'res_{block}.conv1', f'res_{block}.bn1'], [f'res_{block}.conv2', f'res_{block}.bn2']]
+    return fuse_modules(fused, groups, inplace=True)
+
+
+def export_net(net, input_shape, quantize=False):
+    """
+    Input:
+        net: GomakuNet to export
+        input_shape: the shape of one network input, see NNetWrapper.input_shape
+        quantize: quantize the weights of the fully connected layers to int8,
+                  activations are quantized on the fly (cpu only)
+
+    Returns:
+        module: a frozen TorchScript module of the fused net, with the same
+                inputs and outputs as net
+    """
+    module = fuse(net)
+    # torch.ao.quantization and TorchScript warn that they are deprecated in favour of torchao and torch.export
+    with warnings.catch_warnings(), torch.no_grad():
+        warnings.simplefilter('ignore', FutureWarning)
+        warnings.simplefilter('ignore', UserWarning)
+        if quantize:
+            module = quantize_dynamic(module, {nn.Linear}, dtype=torch.qint8, inplace=True)
+        module = torch.jit.trace(module, torch.zeros(1, *input_shape))
+        return torch.jit.freeze(module)
+
+
+def export_onnx(net, input_shape, filepath):
+    """
+    Saves the fused GomakuNet net as an ONNX model with a dynamic batch size,
+    with input 'board' and outputs 'pi' (log probabilities) and 'v'.
+
+    Returns:
+        filepath
+    """
+    module = fuse(net)
+    with warnings.catch_warnings(), torch.no_grad():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        warnings.simplefilter('ignore', FutureWarning)
+        torch.onnx.export(module, (torch.zeros(1, *input_shape),), filepath, dynamo=False,
+                          input_names=['board'], output_names=['pi', 'v'],
+                          dynamic_axes={'board': {0: 'batch'}, 'pi': {0: 'batch'}, 'v': {0: 'batch'}})
+    return filepath
+
+
+def sample_inputs(game, num_inputs, seed=0):
+    """
+    Returns the network inputs of num_inputs positions of random games as a
+    stacked float32 array, to check and time exported models on.
+    """
+    rng = np.random.RandomState(seed)
+    inputs = []
+    while len(inputs) < num_inputs:
+        board = game.getInitBoard(0)
+        action = None
+        while game.getGameEnded(board, 1) == 0 and len(inputs) < num_inputs:
+            planes = game.getFeaturePlanes(board, action)
+            inputs.append(board if planes is None else planes)
+            action = rng.choice(np.flatnonzero(game.getValidMoves(board, 1)))
+            board, player = game.getNextState(board, 1, action)
+            board = game.getCanonicalForm(board, player)
+    return np.array(inputs, dtype=np.float32)
+
+
+def check_export(net, module, inputs):
+    """
+    Returns:
+        (pi_error, v_error): the largest absolute differences between the
+                             policies and the values of net and module
+    """
+    net_device = next(net.parameters()).device
+    net.eval()
+    with torch.no_grad():
+        pi, v = net(torch.from_numpy(inputs).to(net_device))
+        exported_pi, exported_v = module(torch.from_numpy(inputs))
+    pi_error = (torch.exp(pi).cpu() - torch.exp(exported_pi)).abs().max().item()
+    v_error = (v.view(-1).cpu() - exported_v.view(-1)).abs().max().item()
+    return pi_error, v_error
+
+
+def benchmark_latency(model, inputs, batch_sizes=(1, 64), repeats=50):
+    """
+    Returns a dict from batch size to the mean seconds per forward pass of
+    model on the first batch size inputs.
+    """
+    latencies = {}
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            batch = torch.from_numpy(inputs[:batch_size])
+            model(batch)  # warm up, TorchScript optimizes on the first calls
+            start = time()
+            for _ in range(repeats):
+                model(batch)
+            latencies[batch_size] = (time() - start) / repeats
+    return latencies
+
+
+if __name__ == "__main__":
+    from gomaku.GomakuGame import GomakuGame
+    from gomaku.pytorch.NNet import NNetWrapper, args as default_args
+
+    parser = argparse.ArgumentParser(description="Export a Gomoku checkpoint for inference")
+    parser.add_argument("folder")
+    parser.add_argument("filename")
+    parser.add_argument("--quantize", action="store_true", help="int8 weights for the fully connected layers")
+    parser.add_argument("--num_channels", type=int, default=default_args.num_channels)
+    parser.add_argument("--res_blocks", type=int, default=default_args.res_blocks)
+    parser.add_argument("--feature_planes", action="store_true", help="the checkpoint takes GomakuGame feature planes")
+    parser.add_argument("--threat_planes", action="store_true", help="the checkpoint takes feature planes with threats")
+    cli = parser.parse_args()
+
+    g = GomakuGame(8, featurePlanes=cli.feature_planes, threatPlanes=cli.threat_planes)
+    net_args = dotdict({**default_args, 'num_channels': cli.num_channels, 'res_blocks': cli.res_blocks})
+    nnet = NNetWrapper(g, net_args)
+    nnet.load_checkpoint(cli.folder, cli.filename)
+    path = nnet.export_checkpoint(cli.folder, cli.filename, quantize=cli.quantize)
+    exported = NNetWrapper(g, net_args)
+    exported.load_checkpoint(*os.path.split(path))
+    exported = exported.exported
+
+    inputs = sample_inputs(g, 256)
+    pi_error, v_error = check_export(nnet.nnet, exported, inputs)
+    print(f"max |pi - pi'| = {pi_error:.2e}, max |v - v'| = {v_error:.2e}")
+    nnet.nnet.cpu().eval()
+    for name, model in (('checkpoint', nnet.nnet), ('exported', exported)):
+        latencies = benchmark_latency(model, inputs)
+        print(name + ': ' + ', '.join(f'batch {b}: {1000 * t:.2f} ms' for b, t in latencies.items()))
@@ -15,14 +15,15 @@ from utils import dotdict
 
 
 class InputBlock(nn.Module):
-    def __init__(self, board_size: int, args: dotdict):
+    def __init__(self, board_size: int, in_channels: int, args: dotdict):
         super(InputBlock, self).__init__()
         self.board_size = board_size
-        self.conv = nn.Conv2d(1, args.num_channels, 3, stride=1, padding=1)
+        self.in_channels = in_channels
+        self.conv = nn.Conv2d(in_channels, args.num_channels, 3, stride=1, padding=1)
         self.bn = nn.BatchNorm2d(args.num_channels)
 
     def forward(self, s):
-        s = s.view(-1, 1, self.board_size, self.board_size)
+        s = s.view(-1, self.in_channels, self.board_size, self.board_size)
         s = F.relu(self.bn(self.conv(s)))
         return s
 
@@ -82,7 +83,10 @@ class GomakuNet(nn.Module):
         self.args = args
         self.board_size = self.game.getBoardSize()[0]
         self.action_size = self.game.getActionSize()
-        self.input = InputBlock(self.board_size, self.args)
+        # one input channel per feature plane of the game, or the board itself
+        input_shape = self.game.getInputShape()
+        self.in_channels = 1 if len(input_shape) == 2 else input_shape[0]
+        self.input = InputBlock(self.board_size, self.in_channels, self.args)
         for block in range(self.args.res_blocks):
             setattr(self, f"res_{block}", ResBlock(self.args.num_channels, self.args.num_channels))
         self.out = OutBlock(self.args.num_channels, self.action_size, self.board_size)
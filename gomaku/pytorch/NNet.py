@@ -1,6 +1,8 @@
+import logging
 import os
 import sys
-import time
+import uuid
+import warnings
 
 import numpy as np
 try:
@@ -21,6 +23,8 @@ import torch.optim as optim
 # from .GomakuNNet import GomakuNNet as onnet
 from .GomakuNNetResidual import GomakuNet as onnet
 
+log = logging.getLogger(__name__)
+
 args = dotdict({
     'lr': 0.001,
     'dropout': 0.3,
@@ -38,15 +42,37 @@ class NNetWrapper(NeuralNet):
         self.nnet = onnet(game, net_args or args)
         self.board_x, self.board_y = game.getBoardSize()
         self.action_size = game.getActionSize()
+        # the shape of the network input: the board, or the feature planes if the game provides them
+        self.input_shape = game.getInputShape()
+        self.version = uuid.uuid4().hex  # changes whenever the weights change
+        self.exported = None  # TorchScript module used for inference if an exported checkpoint was loaded
+        self.inputs = None  # float32 buffer the boards are copied into for inference, see prepare
+
+        # training batches are augmented with a random symmetry of every example, see Game.getSymmetryPermutations
+        symmetries = game.getSymmetryPermutations()
+        self.symmetries = None if symmetries is None else torch.from_numpy(np.asarray(symmetries, dtype=np.int64))
 
         if args.cuda:
             self.nnet.cuda()
+            if self.symmetries is not None: self.symmetries = self.symmetries.cuda()
 
-    def train(self, examples):
+    def train(self, examples, augment=True):
         """
-        examples: list of examples, each example is of form (board, pi, v)
+        examples: list of examples, each example is of form (board, pi, v), or
+                  ShardedExamples whose batches are gathered with sample()
+        augment: the examples hold every position once (Coach with
+                 lazySymmetries), so every example of a batch gets a random
+                 symmetry and an epoch makes as many steps as if all the
+                 symmetric forms had been stored. The examples of shards
+                 that already hold all the forms (converted pickles of older
+                 runs) are neither augmented nor counted again.
         """
         optimizer = optim.Adam(self.nnet.parameters())
+        # lists are packed into tensors once, ShardedExamples are read from disk a batch at a time
+        sharded = hasattr(examples, 'sample')
+        packed = None if sharded else self.pack_examples(examples)
+        augment = augment and self.symmetries is not None
+        num_forms = len(self.symmetries) if augment else 1
 
         for epoch in range(args.epochs):
             print('EPOCH ::: ' + str(epoch + 1))
@@ -54,22 +80,22 @@ class NNetWrapper(NeuralNet):
             pi_losses = AverageMeter()
             v_losses = AverageMeter()
 
-            batch_count = int(len(examples) / args.batch_size)
+            num_examples = examples.countForms(num_forms) if sharded else len(examples) * num_forms
+            batch_count = int(num_examples / args.batch_size)
 
             t = tqdm(range(batch_count), desc='Training Net')
             for _ in t:
-                sample_ids = np.random.randint(len(examples), size=args.batch_size)
-                boards, pis, vs = list(zip(*[examples[i] for i in sample_ids]))
-                boards = torch.FloatTensor(np.array(boards).astype(np.float64))
-                target_pis = torch.FloatTensor(np.array(pis))
-                target_vs = torch.FloatTensor(np.array(vs).astype(np.float64))
-
-                # predict
-                if args.cuda:
-                    boards, target_pis, target_vs = boards.contiguous().cuda(), target_pis.contiguous().cuda(), target_vs.contiguous().cuda()
+                if sharded:
+                    sample_ids = examples.sampleIds(args.batch_size, num_forms)
+                else:
+                    sample_ids = np.random.randint(len(examples), size=args.batch_size)
+                boards, target_pis, target_vs = self.gather_batch(examples, packed, sample_ids)
+                if augment:
+                    mask = examples.isCanonical(sample_ids) if sharded else None
+                    boards, target_pis = self.augment(boards, target_pis, mask)
 
                 # compute output
-                out_pi, out_v = self.nnet(boards)
+                out_pi, out_v = self.nnet(boards.float())
                 l_pi = self.loss_pi(target_pis, out_pi)
                 l_v = self.loss_v(target_vs, out_v)
                 total_loss = l_pi + l_v
@@ -84,23 +110,102 @@ class NNetWrapper(NeuralNet):
                 total_loss.backward()
                 optimizer.step()
 
+        self.version = uuid.uuid4().hex
+        self.exported = None
+
+    def pack_examples(self, examples):
+        """
+        Copies a list of examples into contiguous tensors, on the gpu if cuda
+        is used, so that the batches of train() are gathered by indexing.
+        Boards stay int8 and are only converted to float32 a batch at a time.
+
+        Returns:
+            (boards, pis, vs): tensors holding all examples
+        """
+        return self.to_tensors(*zip(*examples))
+
+    def gather_batch(self, examples, packed, ids):
+        """
+        Returns:
+            (boards, pis, vs): tensors of the examples ids, indexed from the
+                               tensors of pack_examples, or read from the
+                               memory-mapped shards if packed is None
+        """
+        if packed is None:
+            return self.to_tensors(*examples.sample(ids))
+        ids = torch.from_numpy(ids)
+        if args.cuda: ids = ids.cuda()
+        return tuple(x[ids] for x in packed)
+
+    def to_tensors(self, boards, pis, vs):
+        boards = torch.from_numpy(np.asarray(boards, dtype=np.int8))
+        pis = torch.from_numpy(np.asarray(pis, dtype=np.float32))
+        vs = torch.from_numpy(np.asarray(vs, dtype=np.float32))
+        if args.cuda:
+            boards, pis, vs = boards.cuda(), pis.cuda(), vs.cuda()
+        return boards, pis, vs
+
+    def augment(self, boards, pis, mask=None):
+        """
+        Applies an independent random symmetry to every example of a batch,
+        or only to the examples where the boolean np array mask is True.
+
+        Returns:
+            (boards, pis): the transformed batch
+        """
+        permutations = self.symmetries[torch.randint(len(self.symmetries), (len(boards),), device=boards.device)]
+        if mask is not None and not mask.all():
+            keep = torch.from_numpy(~mask).to(boards.device)
+            permutations[keep] = torch.arange(permutations.shape[1], device=boards.device)
+        # the same permutation of the cells for every plane of an example
+        planes = boards.view(len(boards), -1, permutations.shape[1])
+        boards = planes.gather(2, permutations.unsqueeze(1).expand_as(planes)).view(boards.shape)
+        return boards, pis.gather(1, permutations)
+
     def predict(self, board):
         """
         board: np array with board
         """
-        # timing
-        start = time.time()
+        pi, v = self.forward(self.prepare(board))
+        return torch.exp(pi).cpu().numpy()[0], v.cpu().numpy()[0]
 
-        # preparing input
-        board = torch.FloatTensor(board.astype(np.float64))
-        if args.cuda: board = board.contiguous().cuda()
-        board = board.view(1, self.board_x, self.board_y)
-        self.nnet.eval()
-        with torch.no_grad():
-            pi, v = self.nnet(board)
+    def predict_batch(self, boards):
+        """
+        boards: list or stacked np array of boards, evaluated in one forward pass
+        """
+        pi, v = self.forward(self.prepare(boards))
+
+        return torch.exp(pi).cpu().numpy(), v.cpu().numpy().reshape(-1)
+
+    def prepare(self, boards):
+        """
+        Copies a board, or a list or stacked array of boards, into the input
+        buffer. The buffer is reused across calls and only grows, and the copy
+        converts the boards to float32 on the device of the network at once.
 
-        # print('PREDICTION TIME TAKEN : {0:03f}'.format(time.time()-start))
-        return torch.exp(pi).data.cpu().numpy()[0], v.data.cpu().numpy()[0]
+        Returns:
+            inputs: the part of the buffer holding the boards
+        """
+        boards = np.ascontiguousarray(boards)  # stacks lists, a no-op for stacked arrays
+        boards = boards.reshape(-1, *self.input_shape)
+        device = 'cuda' if args.cuda and self.exported is None else 'cpu'  # exported modules run on the cpu
+        if self.inputs is None or len(self.inputs) < len(boards) or self.inputs.device.type != device:
+            self.inputs = torch.empty((len(boards), *self.input_shape), dtype=torch.float32, device=device)
+        inputs = self.inputs[:len(boards)]
+        inputs.copy_(torch.from_numpy(boards))
+        return inputs
+
+    def forward(self, inputs):
+        """
+        Runs the network, or the exported module if one was loaded, on a batch
+        of inputs from prepare without recording gradients.
+        """
+        with torch.no_grad():
+            if self.exported is not None:
+                return self.exported(inputs)
+            if self.nnet.training:
+                self.nnet.eval()
+            return self.nnet(inputs)
 
     def loss_pi(self, targets, outputs):
         return -torch.sum(targets * outputs) / targets.size()[0]
@@ -117,13 +222,50 @@ class NNetWrapper(NeuralNet):
             print("Checkpoint Directory exists! ")
         torch.save({
             'state_dict': self.nnet.state_dict(),
+            'version': self.version,
         }, filepath)
 
+    def export_checkpoint(self, folder='checkpoint', filename='checkpoint.pth.tar', quantize=False):
+        """
+        Saves the network for inference as a TorchScript module in
+        folder/filename + '.pt', with every BatchNorm folded into its
+        convolution and, if quantize is set, int8 fully connected layers.
+        load_checkpoint accepts the file in place of a checkpoint. The exported
+        network is checked against this one on positions of random games.
+
+        Returns:
+            filepath: the path of the exported file
+        """
+        from .ExportNNet import export_net, sample_inputs, check_export
+
+        module = export_net(self.nnet, self.input_shape, quantize=quantize)
+        pi_error, v_error = check_export(self.nnet, module, sample_inputs(self.nnet.game, 256))
+        if max(pi_error, v_error) > (0.05 if quantize else 1e-4):
+            log.warning(f'Exported network differs from the checkpoint by up to {pi_error:.2e} (pi), {v_error:.2e} (v)')
+
+        if not os.path.exists(folder):
+            os.mkdir(folder)
+        filepath = os.path.join(folder, filename + '.pt')
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', FutureWarning)  # TorchScript is deprecated in favour of torch.export
+            torch.jit.save(module, filepath, _extra_files={'version': self.version})
+        return filepath
+
     def load_checkpoint(self, folder='checkpoint', filename='checkpoint.pth.tar'):
         # https://github.com/pytorch/examples/blob/master/imagenet/main.py#L98
         filepath = os.path.join(folder, filename)
         if not os.path.exists(filepath):
             raise Exception("No model in path {}".format(filepath))
+        if filename.endswith('.pt'):
+            # exported by export_checkpoint, only usable for inference
+            extra_files = {'version': ''}
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', FutureWarning)
+                self.exported = torch.jit.load(filepath, map_location='cpu', _extra_files=extra_files)
+            self.version = extra_files['version'].decode() or uuid.uuid4().hex
+            return
+        self.exported = None
         map_location = None if args.cuda else 'cpu'
         checkpoint = torch.load(filepath, map_location=map_location)
         self.nnet.load_state_dict(checkpoint['state_dict'])
+        self.version = checkpoint.get('version', uuid.uuid4().hex)
@@ -27,12 +27,30 @@ args = dotdict({
     'maxlenOfQueue': 200000,    # Number of game examples to train the neural networks.
     'numMCTSSims': 25,          # Number of games moves for MCTS to simulate.
     'arenaCompare': 40,         # Number of games to play during arena play to determine if new net will be accepted.
+    'arenaSPRT': False,         # Stop the arena as soon as a sequential probability ratio test settles acceptance or rejection.
+    'sprtMargin': 0.1,          # Win rates within sprtMargin of updateThreshold may be accepted or rejected.
+    'sprtAlpha': 0.05,          # Probability of accepting a new net with win rate updateThreshold - sprtMargin.
+    'sprtBeta': 0.05,           # Probability of rejecting a new net with win rate updateThreshold + sprtMargin.
     'cpuct': 1,
+    'mctsBatchSize': 1,         # Number of MCTS leaves evaluated in one network call (1 evaluates every simulation on its own).
+    'reuseTree': False,         # Keep the subtree of the played move and count its visits towards numMCTSSims.
+    'virtualLoss': 1,           # Visits counted as losses on a path while its leaf waits for a batched evaluation.
+    'numSelfPlayWorkers': 1,    # Number of processes playing self-play games, each with its own copy of the network.
+    'numSelfPlayThreads': 1,    # Number of self-play games played concurrently against one batched inference server.
+    'inferenceBatchSize': 64,   # Largest batch the inference server evaluates at once.
+    'inferenceMaxWait': 0.001,  # Seconds the inference server waits for a batch to fill up.
+    'transpositionTableSize': 2 ** 18,  # Network evaluations cached across the trees of one model version (0 disables the cache).
+    'profileTimers': False,     # Also time selection, game calls and inference in the per-iteration profile (checkpoint/profile.jsonl).
+    'pipelined': False,         # Run self-play, training and the arena concurrently, see Coach.learnPipelined.
 
     'checkpoint': './temp/',
     'load_model': False,
     'load_folder_file': ('/dev/models/8x100x50','best.pth.tar'),
     'numItersForTrainExamplesHistory': 20,
+    'exportModel': False,       # Also save best.pth.tar.pt, a faster TorchScript version of every accepted model.
+    'exportQuantize': False,    # Quantize the fully connected layers of the exported model to int8.
+    'lazySymmetries': True,     # Store every position once and train on a random symmetry of it instead of storing all symmetries.
+    'seed': SEED,               # Self-play worker i of iteration it seeds its random generators with seed + 1000 * it + i.
 
 })
 
@@ -0,0 +1,130 @@
+"""
+
+    Tests of the arena: the bounds of the SPRT and the early stop it gives
+    Arena.playGames. Requires numpy.
+
+"""
+
+import math
+import unittest
+
+import numpy as np
+
+from Arena import Arena
+from SPRT import SPRT
+
+
+class OneMoveGame():
+    """
+    A game that ends after one move: playing 1 wins it, playing 0 resigns.
+    """
+
+    def getInitBoard(self):
+        return np.zeros(1, dtype=int)
+
+    def getValidMoves(self, board, player):
+        return np.ones(2, dtype=int)
+
+    def getNextState(self, board, player, action):
+        return np.array([player if action == 1 else -player]), -player
+
+    def getCanonicalForm(self, board, player):
+        return board * player
+
+    def getGameEnded(self, board, player):
+        return board[0] * player
+
+    def getGameEndedAfterMove(self, board, player, action):
+        return self.getGameEnded(board, player)
+
+
+def strong(board):
+    return 1
+
+
+def weak(board):
+    return 0
+
+
+class TestSPRT(unittest.TestCase):
+
+    def test_bounds(self):
+        sprt = SPRT(0.45, 0.65, alpha=0.05, beta=0.1)
+        self.assertAlmostEqual(sprt.upper, math.log(0.9 / 0.05))
+        self.assertAlmostEqual(sprt.lower, math.log(0.1 / 0.95))
+        # the fewest straight wins and losses that settle the test
+        wins = math.ceil(sprt.upper / sprt.winWeight)
+        losses = math.ceil(sprt.lower / sprt.lossWeight)
+        self.assertEqual(sprt.test(wins - 1, 0), 0)
+        self.assertEqual(sprt.test(wins, 0), 1)
+        self.assertEqual(sprt.test(0, losses - 1), 0)
+        self.assertEqual(sprt.test(0, losses), -1)
+        # an even score leans towards H0 but does not settle it yet
+        self.assertEqual(sprt.test(10, 10), 0)
+        self.assertGreater(sprt.llr(10, 5), sprt.llr(10, 6))
+
+    def test_around(self):
+        sprt = SPRT.around(0.55, 0.1)
+        self.assertAlmostEqual(sprt.p0, 0.45)
+        self.assertAlmostEqual(sprt.p1, 0.65)
+        sprt = SPRT.around(0.95, 0.1)
+        self.assertTrue(0 < sprt.p0 < sprt.p1 < 1)
+
+    def test_error_rates(self):
+        sprt = SPRT(0.45, 0.65, alpha=0.05, beta=0.05)
+        rng = np.random.RandomState(0)
+
+        def accepts(p):
+            wins = losses = 0
+            while True:
+                if rng.random_sample() < p:
+                    wins += 1
+                else:
+                    losses += 1
+                result = sprt.test(wins, losses)
+                if result != 0:
+                    return result == 1
+
+        runs = 2000
+        # Wald's bounds: at most alpha / (1 - beta) and beta / (1 - alpha)
+        self.assertLess(np.mean([accepts(0.45) for _ in range(runs)]), 0.05 / 0.95 + 0.01)
+        self.assertLess(np.mean([not accepts(0.65) for _ in range(runs)]), 0.05 / 0.95 + 0.01)
+
+
+class TestArena(unittest.TestCase):
+
+    def test_full_match(self):
+        arena = Arena(strong, weak, OneMoveGame())
+        self.assertEqual(arena.playGames(10), (10, 0, 0))
+        arena = Arena(weak, strong, OneMoveGame())
+        self.assertEqual(arena.playGames(10), (0, 10, 0))
+
+    def test_stop(self):
+        calls = []
+
+        def stop(oneWon, twoWon, draws):
+            calls.append((oneWon, twoWon, draws))
+            return False
+
+        Arena(strong, weak, OneMoveGame()).playGames(6, stop=stop)
+        # called after every pair of games
+        self.assertEqual(calls, [(2, 0, 0), (4, 0, 0), (6, 0, 0)])
+
+    def test_sprt_stops_early(self):
+        sprt = SPRT.around(0.55, 0.1)
+        wins = math.ceil(sprt.upper / sprt.winWeight)
+        # the stop Coach gives the arena, the new network being player2
+        arena = Arena(weak, strong, OneMoveGame())
+        pwins, nwins, draws = arena.playGames(100, stop=lambda pwins, nwins, draws: sprt.test(nwins, pwins) != 0)
+        self.assertEqual((pwins, nwins, draws), (0, wins + wins % 2, 0))
+        self.assertEqual(sprt.test(nwins, pwins), 1)
+
+        arena = Arena(strong, weak, OneMoveGame())
+        losses = math.ceil(sprt.lower / sprt.lossWeight)
+        pwins, nwins, draws = arena.playGames(100, stop=lambda pwins, nwins, draws: sprt.test(nwins, pwins) != 0)
+        self.assertEqual((pwins, nwins, draws), (losses + losses % 2, 0, 0))
+        self.assertEqual(sprt.test(nwins, pwins), -1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,399 @@
+"""
+
+    Tests of the Gomoku win detection, bitboards and the Zobrist hashing of its
+    symmetries against straightforward implementations. Only numpy is required.
+
+"""
+
+import math
+import unittest
+
+import numpy as np
+
+from MCTS import MCTS
+from gomaku.GomakuGame import GomakuGame
+from gomaku.GomakuLogic import exactFives, fromCells
+from utils import dotdict
+
+
+def runs(board, colour):
+    """
+    Returns the maximal runs of stones of colour on board as lists of flat cell
+    indices, in the four directions of a line.
+    """
+    n = board.shape[0]
+    found = []
+    for d_y, d_x in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        for y in range(n):
+            for x in range(n):
+                # only start at the first stone of a run
+                if board[y, x] != colour:
+                    continue
+                if 0 <= y - d_y < n and 0 <= x - d_x < n and board[y - d_y, x - d_x] == colour:
+                    continue
+                run = []
+                cur_y, cur_x = y, x
+                while 0 <= cur_y < n and 0 <= cur_x < n and board[cur_y, cur_x] == colour:
+                    run.append(cur_y * n + cur_x)
+                    cur_y += d_y
+                    cur_x += d_x
+                found.append(run)
+    return found
+
+
+def bruteFives(board, colour, through=None):
+    return any(len(run) == 5 and (through is None or through in run) for run in runs(board, colour))
+
+
+def bruteFivesThrough(board, colour):
+    """
+    Returns the set of cells that are part of exactly five stones of colour in a row.
+    """
+    return {cell for run in runs(board, colour) if len(run) == 5 for cell in run}
+
+
+def randomBoards(n, count, seed):
+    rng = np.random.RandomState(seed)
+    for _ in range(count):
+        density = rng.uniform(0.2, 0.9)
+        board = rng.choice([1, -1], size=(n, n)) * (rng.uniform(size=(n, n)) < density)
+        yield board.astype(np.int8)
+
+
+class TestExactFives(unittest.TestCase):
+
+    def assertMatchesBruteForce(self, board):
+        n = board.shape[0]
+        for colour in (1, -1):
+            stones = fromCells(board.ravel() == colour)
+            cells = bruteFivesThrough(board, colour)
+            self.assertEqual(exactFives(stones, n), len(cells) > 0)
+            found = {action for action in range(n * n) if exactFives(stones, n, action)}
+            self.assertEqual(found, cells, board)
+
+    def test_random_boards(self):
+        for n in (5, 8, 9, 15):
+            for board in randomBoards(n, 100, seed=n):
+                self.assertMatchesBruteForce(board)
+
+    def test_lines_at_the_edges(self):
+        n = 8
+        for d_y, d_x in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            for y in range(n):
+                for x in range(n):
+                    for length in (4, 5, 6, 7):
+                        cells = [(y + k * d_y, x + k * d_x) for k in range(length)]
+                        if not all(0 <= cur_y < n and 0 <= cur_x < n for cur_y, cur_x in cells):
+                            continue
+                        board = np.zeros((n, n), dtype=np.int8)
+                        for cur_y, cur_x in cells:
+                            board[cur_y, cur_x] = 1
+                        self.assertEqual(exactFives(fromCells(board.ravel() == 1), n), length == 5)
+                        self.assertMatchesBruteForce(board)
+
+    def test_overlines(self):
+        board = np.zeros((8, 8), dtype=np.int8)
+        board[3, 1:7] = 1
+        self.assertFalse(exactFives(fromCells(board.ravel() == 1), 8))
+        # a gap splits the six into a five and a single stone
+        board[3, 6] = 0
+        board[3, 7] = 1
+        self.assertTrue(exactFives(fromCells(board.ravel() == 1), 8))
+        self.assertFalse(exactFives(fromCells(board.ravel() == 1), 8, through=3 * 8 + 7))
+
+    def test_rows_do_not_wrap(self):
+        # three stones at the end of a row followed by two at the start of the next
+        board = np.zeros((8, 8), dtype=np.int8)
+        board.flat[21:26] = 1
+        self.assertFalse(exactFives(fromCells(board.ravel() == 1), 8))
+        self.assertMatchesBruteForce(board)
+
+    def test_game_win_checks(self):
+        game = GomakuGame(8)
+        for board in randomBoards(8, 300, seed=0):
+            expected = 1 if bruteFives(board, 1) else -1 if bruteFives(board, -1) else 0
+            self.assertEqual(game.findWinner(board), expected)
+            cells = {colour: bruteFivesThrough(board, colour) for colour in (1, -1)}
+            for action in range(64):
+                colour = board.flat[action]
+                expected = int(colour) if colour != 0 and action in cells[colour] else 0
+                self.assertEqual(game.findWinnerThrough(board, action), expected)
+
+
+class ArrayGomakuGame(GomakuGame):
+    """
+    GomakuGame without bitboards, so that MCTS keeps the boards in its rows.
+    """
+
+    def toBitboard(self, board):
+        return None
+
+
+class FixedNet():
+    """
+    Deterministic stand-in for a network: a policy and value that depend on
+    every cell of the input.
+    """
+
+    version = 0
+
+    def predict(self, board):
+        cells = np.ravel(board).astype(np.float64)
+        x = np.sin(0.37 * np.arange(64) + 0.01 * cells.dot(np.arange(len(cells))))
+        pi = np.exp(x)
+        return pi / pi.sum(), np.array([np.tanh(0.1 * cells.sum() + x[0])])
+
+    def predict_batch(self, boards):
+        pis, vs = zip(*[self.predict(board) for board in boards])
+        return np.array(pis), np.ravel(vs)
+
+
+def searchGame(game, args, moves=10, seed=0):
+    """
+    Returns the visit counts of the root of an MCTS at every move of a game
+    that plays the most visited move.
+    """
+    np.random.seed(seed)
+    board = game.getInitBoard()
+    mcts = MCTS(game, FixedNet(), args)
+    player, action, counts = 1, None, []
+    for _ in range(moves):
+        canonicalBoard = game.getCanonicalForm(board, player)
+        pi = mcts.getActionProb(canonicalBoard, temp=1, lastAction=action)
+        counts.append(mcts.Nsa[mcts.root].copy())
+        action = int(np.argmax(pi))
+        board, player = game.getNextState(board, player, action)
+        if game.getGameEnded(board, 1) != 0:
+            break
+    return np.array(counts)
+
+
+class DictMCTS():
+    """
+    The search as it was before the node table: per-edge statistics in dicts
+    keyed by (board, action), the first action with the highest bound chosen.
+    """
+
+    def __init__(self, game, nnet, args):
+        self.game = game
+        self.nnet = nnet
+        self.args = args
+        self.Qsa = {}
+        self.Nsa = {}
+        self.Ns = {}
+        self.Ps = {}
+        self.Es = {}
+        self.Vs = {}
+
+    def getCounts(self, canonicalBoard):
+        for _ in range(self.args.numMCTSSims):
+            self.search(canonicalBoard)
+        s = self.game.stateKey(canonicalBoard)
+        return np.array([self.Nsa.get((s, a), 0) for a in range(self.game.getActionSize())])
+
+    def search(self, canonicalBoard):
+        s = self.game.stateKey(canonicalBoard)
+        if s not in self.Es:
+            self.Es[s] = self.game.getGameEnded(canonicalBoard, 1)
+        if self.Es[s] != 0:
+            return -self.Es[s]
+
+        if s not in self.Ps:
+            Ps, v = self.nnet.predict(canonicalBoard)
+            valids = self.game.getValidMoves(canonicalBoard, 1)
+            Ps = Ps * valids
+            self.Ps[s] = Ps / np.sum(Ps)
+            self.Vs[s] = valids
+            self.Ns[s] = 0
+            return -v[0]
+
+        cur_best, best_act = -float('inf'), -1
+        for a in range(self.game.getActionSize()):
+            if self.Vs[s][a]:
+                if (s, a) in self.Qsa:
+                    u = self.Qsa[(s, a)] + self.args.cpuct * self.Ps[s][a] * math.sqrt(self.Ns[s]) / (
+                            1 + self.Nsa[(s, a)])
+                else:
+                    u = self.args.cpuct * self.Ps[s][a] * math.sqrt(self.Ns[s] + 1e-8)
+                if u > cur_best:
+                    cur_best, best_act = u, a
+
+        a = best_act
+        next_s, next_player = self.game.getNextState(canonicalBoard, 1, a)
+        v = self.search(self.game.getCanonicalForm(next_s, next_player))
+
+        if (s, a) in self.Qsa:
+            self.Qsa[(s, a)] = (self.Nsa[(s, a)] * self.Qsa[(s, a)] + v) / (self.Nsa[(s, a)] + 1)
+            self.Nsa[(s, a)] += 1
+        else:
+            self.Qsa[(s, a)] = v
+            self.Nsa[(s, a)] = 1
+        self.Ns[s] += 1
+        return -v
+
+
+def gamePositions(game, count, seed):
+    """
+    Returns count canonical boards of random games, none of them decided.
+    """
+    rng = np.random.RandomState(seed)
+    np.random.seed(seed)
+    boards = []
+    while len(boards) < count:
+        board, player = game.getInitBoard(), 1
+        for _ in range(rng.randint(0, 30)):
+            board, player = game.getNextState(board, player, rng.choice(np.flatnonzero(game.getValidMoves(board, 1))))
+            if game.getGameEnded(board, 1) != 0:
+                break
+        else:
+            boards.append(game.getCanonicalForm(board, player))
+    return boards
+
+
+class TestMCTS(unittest.TestCase):
+
+    def test_same_visit_counts_as_the_dict_tree(self):
+        game = GomakuGame(8)
+        args = dotdict({'numMCTSSims': 200, 'cpuct': 1.0})
+        for board in gamePositions(game, 8, seed=5):
+            mcts = MCTS(game, FixedNet(), args)
+            mcts.getActionProb(board, temp=1)
+            expected = DictMCTS(game, FixedNet(), args).getCounts(board)
+            self.assertEqual(expected.sum(), args.numMCTSSims - 1)  # the first simulation expands the root
+            np.testing.assert_array_equal(mcts.Nsa[mcts.root], expected)
+
+
+class TestBitboard(unittest.TestCase):
+
+    def test_game_methods_match_the_array_methods(self):
+        game = GomakuGame(8)
+        for board in randomBoards(8, 300, seed=4):
+            bitboard = game.toBitboard(board)
+            np.testing.assert_array_equal(game.fromBitboard(bitboard), board)
+            np.testing.assert_array_equal(game.getBitboardValidMoves(bitboard), game.getValidMoves(board, 1))
+            self.assertEqual(game.getBitboardGameEnded(bitboard), game.getGameEnded(board, 1))
+            for action in np.flatnonzero(board.ravel() == 0)[:4]:
+                nextBoard, player = game.getNextState(board, 1, action)
+                nextBoard = game.getCanonicalForm(nextBoard, player)
+                nextBitboard = game.getNextBitboard(bitboard, action)
+                self.assertEqual(nextBitboard, game.toBitboard(nextBoard))
+                self.assertEqual(game.getBitboardGameEnded(nextBitboard, action),
+                                 game.getGameEndedAfterMove(nextBoard, 1, action))
+
+    def test_full_board(self):
+        game = GomakuGame(5)
+        board = np.array([[1, 1, -1, -1, 1]] * 5, dtype=np.int8)
+        board[1::2] *= -1
+        self.assertEqual(game.getBitboardGameEnded(game.toBitboard(board)), game.getGameEnded(board, 1))
+        self.assertNotEqual(game.getGameEnded(board, 1), 0)
+
+    def test_mcts_rows_of_bitboards(self):
+        for featurePlanes in (False, True):
+            for extra in ({}, {'reuseTree': True}, {'mctsBatchSize': 8}):
+                args = dotdict({'numMCTSSims': 50, 'cpuct': 1.0, **extra})
+                counts = searchGame(GomakuGame(8, featurePlanes=featurePlanes), args)
+                expected = searchGame(ArrayGomakuGame(8, featurePlanes=featurePlanes), args)
+                np.testing.assert_array_equal(counts, expected)
+
+
+class TestFeaturePlanes(unittest.TestCase):
+
+    def test_incremental_planes(self):
+        for threatPlanes in (False, True):
+            game = GomakuGame(8, featurePlanes=True, threatPlanes=threatPlanes)
+            rng = np.random.RandomState(6)
+            for _ in range(20):
+                board = np.zeros((8, 8), dtype=np.int8)
+                planes = game.getFeaturePlanes(board)
+                for action in rng.permutation(64)[:rng.randint(1, 64)]:
+                    board, player = game.getNextState(board, 1, action)
+                    board = game.getCanonicalForm(board, player)
+                    planes = game.getNextFeaturePlanes(planes, board, action)
+                    np.testing.assert_array_equal(planes, game.getFeaturePlanes(board, action))
+
+    def test_input_shape(self):
+        for kwargs in ({}, {'featurePlanes': True}, {'featurePlanes': True, 'threatPlanes': True}):
+            game = GomakuGame(8, **kwargs)
+            planes = game.getFeaturePlanes(game.getInitBoard(0))
+            self.assertEqual(game.getInputShape(), game.getBoardSize() if planes is None else planes.shape)
+
+    def test_transpositions_keep_their_last_move(self):
+        args = dotdict({'numMCTSSims': 2, 'cpuct': 1.0})
+        for gameClass in (GomakuGame, ArrayGomakuGame):
+            for featurePlanes in (False, True):
+                game = gameClass(8, featurePlanes=featurePlanes)
+                mcts = MCTS(game, FixedNet(), args)
+                root = mcts.getNode(game.getInitBoard(0))
+                # the same stones, the last move being 20 or 10
+                s = mcts.getChild(mcts.getChild(mcts.getChild(root, 10), 30), 20)
+                t = mcts.getChild(mcts.getChild(mcts.getChild(root, 20), 30), 10)
+                np.testing.assert_array_equal(mcts.board(s), mcts.board(t))
+                if not featurePlanes:
+                    self.assertEqual(s, t)
+                    continue
+                self.assertNotEqual(s, t)
+                np.testing.assert_array_equal(mcts.planes[s], game.getFeaturePlanes(mcts.board(s), 20))
+                np.testing.assert_array_equal(mcts.planes[t], game.getFeaturePlanes(mcts.board(t), 10))
+
+    def test_threats_complete_five(self):
+        game = GomakuGame(8, threatPlanes=True)
+        for board in randomBoards(8, 200, seed=7):
+            threats = game.getThreatPlanes(board)
+            for i, colour in enumerate((1, -1)):
+                for action in range(64):
+                    if board.flat[action] != 0:
+                        self.assertEqual(threats[i].flat[action], 0)
+                        continue
+                    nextBoard, _ = game.getNextState(board, colour, action)
+                    self.assertEqual(threats[i].flat[action], game.findWinnerThrough(nextBoard, action) == colour)
+
+
+class TestZobrist(unittest.TestCase):
+
+    def setUp(self):
+        self.game = GomakuGame(8)
+
+    def oneHot(self, action):
+        x = np.zeros(self.game.getActionSize(), dtype=np.int8)
+        x[action] = 1
+        return x
+
+    def test_symmetries_share_a_class(self):
+        game = self.game
+        for board in randomBoards(8, 50, seed=1):
+            action = int(np.flatnonzero(board.ravel() == -1)[0]) if (board == -1).any() else 0
+            classes = set()
+            representatives = set()
+            for t in range(8):
+                symmetric = game.applySymmetry(board, t)
+                symmetricAction = int(np.flatnonzero(game.applySymmetry(self.oneHot(action), t))[0])
+                key, symmetry = game.getZobristClass(game.getZobristKeys(symmetric), symmetricAction)
+                classes.add(key)
+                # the symmetry of the class maps the board and its last move to the same representative
+                representatives.add((game.applySymmetry(symmetric, symmetry).tobytes(),
+                                     game.applySymmetry(self.oneHot(symmetricAction), symmetry).tobytes()))
+            self.assertEqual(len(classes), 1)
+            self.assertEqual(len(representatives), 1)
+
+    def test_last_move_changes_the_class(self):
+        game = self.game
+        board = next(randomBoards(8, 1, seed=2))
+        keys = game.getZobristKeys(board)
+        actions = np.flatnonzero(board.ravel() == -1)[:2]
+        self.assertNotEqual(game.getZobristClass(keys)[0], game.getZobristClass(keys, actions[0])[0])
+        self.assertNotEqual(game.getZobristClass(keys, actions[0])[0], game.getZobristClass(keys, actions[1])[0])
+
+    def test_incremental_keys(self):
+        game = self.game
+        board = np.zeros((8, 8), dtype=np.int8)
+        keys = game.getZobristKeys(board)
+        rng = np.random.RandomState(3)
+        for action in rng.permutation(64)[:30]:
+            board, player = game.getNextState(board, 1, action)
+            board = game.getCanonicalForm(board, player)
+            keys = game.getNextZobristKeys(keys, action)
+            np.testing.assert_array_equal(keys, game.getZobristKeys(board))
+
+
+if __name__ == '__main__':
+    unittest.main()
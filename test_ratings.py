@@ -0,0 +1,81 @@
+"""
+
+    Tests of the Bradley-Terry ratings of the tournament: the fit recovers the
+    strengths that generated the results, and choosePairs schedules games
+    between rated players. Requires numpy.
+
+"""
+
+import itertools
+import unittest
+
+import numpy as np
+
+from Ratings import Ratings
+
+STRENGTHS = {'a': -300, 'b': -100, 'c': 0, 'd': 150, 'e': 250}
+
+
+def playStats(strengths, games, seed):
+    """
+    Returns the ResultStore.stats of games games between every pair of players
+    of strengths, their results drawn from the Elo expected scores.
+    """
+    rng = np.random.RandomState(seed)
+    stats = {}
+    for p1, p2 in itertools.combinations(strengths, 2):
+        score = 1 / (1 + 10 ** ((strengths[p2] - strengths[p1]) / 400))
+        p1Wins = rng.binomial(games, score)
+        stats[(p1, p2)] = (p1Wins, games - p1Wins, 0)
+    return stats
+
+
+class TestRatings(unittest.TestCase):
+
+    def test_recovers_strengths(self):
+        ratings = Ratings(STRENGTHS, playStats(STRENGTHS, 400, seed=0))
+        self.assertAlmostEqual(ratings.elo.mean(), 0)
+        for player, strength in STRENGTHS.items():
+            self.assertLess(abs(ratings.rating(player) - strength), 3 * ratings.std(player))
+            low, high = ratings.interval(player, confidence=0.999)
+            self.assertTrue(low < strength < high)
+        self.assertEqual([row[0] for row in ratings.ladder()], ['e', 'd', 'c', 'b', 'a'])
+        self.assertLess(ratings.maxIntervalWidth(), 100)
+
+    def test_more_games_narrow_the_intervals(self):
+        few = Ratings(STRENGTHS, playStats(STRENGTHS, 20, seed=1))
+        many = Ratings(STRENGTHS, playStats(STRENGTHS, 2000, seed=1))
+        self.assertLess(many.maxIntervalWidth(), few.maxIntervalWidth() / 5)
+
+    def test_draws(self):
+        ratings = Ratings(['x', 'y'], {('x', 'y'): (30, 10, 0)})
+        drawn = Ratings(['x', 'y'], {('x', 'y'): (20, 0, 20)})
+        # a draw counts as half a win for both players
+        self.assertAlmostEqual(ratings.rating('x'), drawn.rating('x'), places=6)
+        self.assertAlmostEqual(ratings.expectedScore('x', 'y'), 0.75, places=2)
+
+    def test_undefeated(self):
+        # the prior keeps the rating of a player that won all its games finite
+        ratings = Ratings(['x', 'y', 'z'], {('x', 'y'): (10, 0, 0), ('y', 'z'): (5, 5, 0), ('x', 'w'): (0, 9, 0)})
+        self.assertTrue(np.isfinite(ratings.elo).all())
+        self.assertGreater(ratings.rating('x'), ratings.rating('y'))
+        self.assertEqual(ratings.games.sum(), 2 * 20)  # the games against w are ignored
+
+    def test_choose_pairs(self):
+        players = list(STRENGTHS) + ['new']
+        ratings = Ratings(players, playStats(STRENGTHS, 50, seed=2))
+        pairs = ratings.choosePairs(10, 4)
+        self.assertEqual(len(pairs), 10)
+        for p1, p2 in pairs:
+            self.assertIn(p1, players)
+            self.assertIn(p2, players)
+            self.assertNotEqual(p1, p2)
+        # the player without games is the most uncertain
+        self.assertIn('new', pairs[0])
+        # later choices account for the games scheduled before them
+        self.assertGreater(len(set(pairs)), 1)
+        self.assertEqual(Ratings(['x'], {}).choosePairs(3, 4), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+"""
+
+    Tests of the training side of Gomoku: the on-disk example store and the
+    symmetries NNetWrapper applies to the training batches. Requires numpy and
+    pytorch.
+
+"""
+
+import os
+import pickle
+import tempfile
+import unittest
+from collections import deque
+
+import numpy as np
+import torch
+
+from Coach import Coach
+from ExampleStore import ExampleStore
+from gomaku.GomakuGame import GomakuGame
+from gomaku.pytorch.NNet import NNetWrapper
+from utils import dotdict
+
+NET_ARGS = dotdict({'num_channels': 8, 'res_blocks': 1, 'dropout': 0.3})
+
+
+def makeExamples(count, seed):
+    rng = np.random.RandomState(seed)
+    return [(rng.choice([-1, 0, 1], size=(8, 8)).astype(np.int8),
+             rng.dirichlet(np.ones(64)).astype(np.float32),
+             float(rng.choice([-1, 1]))) for _ in range(count)]
+
+
+class TestExampleStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assertExamplesEqual(self, examples, expected):
+        self.assertEqual(len(examples), len(expected))
+        for (board, pi, v), (b, p, w) in zip(examples, expected):
+            np.testing.assert_array_equal(board, b)
+            np.testing.assert_array_equal(pi, p)
+            self.assertEqual(v, w)
+
+    def test_round_trip(self):
+        store = ExampleStore(os.path.join(self.folder, 'examples'))
+        iterations = {i: makeExamples(5 + i, seed=i) for i in range(1, 5)}
+        for i, examples in iterations.items():
+            store.addIteration(i, examples, canonical=i % 2 == 0)
+        store.trim(3)
+        self.assertEqual(store.iterations(), [2, 3, 4])
+
+        examples = store.load()
+        expected = iterations[2] + iterations[3] + iterations[4]
+        self.assertExamplesEqual([examples[i] for i in range(len(examples))], expected)
+        np.testing.assert_array_equal(examples.canonical, [True, False, True])
+
+        ids = np.random.RandomState(0).permutation(len(examples))[:10]
+        boards, pis, vs = examples.sample(ids)
+        self.assertExamplesEqual(list(zip(boards, pis, vs)), [expected[i] for i in ids])
+        np.testing.assert_array_equal(examples.isCanonical(ids), [i < 7 or i >= 15 for i in ids])
+
+    def test_forms(self):
+        store = ExampleStore(self.folder)
+        store.addIteration(0, makeExamples(10, seed=0), canonical=True)
+        store.addIteration(1, makeExamples(40, seed=1), canonical=False)
+        examples = store.load()
+        self.assertEqual(examples.countForms(8), 10 * 8 + 40)
+        np.random.seed(0)
+        ids = examples.sampleIds(60000, numForms=8)
+        self.assertTrue(np.all((ids >= 0) & (ids < 50)))
+        # every canonical example stands for 8 forms, so 2/3 of the samples come from the first shard
+        self.assertAlmostEqual(np.mean(ids < 10), 80 / 120, delta=0.01)
+
+    def test_legacy_pickle(self):
+        game = GomakuGame(8)
+        history = [deque(makeExamples(6, seed=i)) for i in range(3)]
+        with open(os.path.join(self.folder, 'best.pth.tar.examples'), 'wb') as f:
+            pickle.dump(history, f)
+        args = dotdict({'checkpoint': os.path.join(self.folder, 'run'), 'load_folder_file': (self.folder, 'best.pth.tar'),
+                        'numMCTSSims': 2, 'cpuct': 1})
+        coach = Coach(game, NNetWrapper(game, NET_ARGS), args)
+        coach.loadTrainExamples()
+        self.assertTrue(coach.skipFirstSelfPlay)
+        self.assertEqual(coach.store.iterations(), [0, 1, 2])
+        examples = coach.store.load()
+        self.assertExamplesEqual([examples[i] for i in range(len(examples))], [e for h in history for e in h])
+        # the pickled examples already hold their symmetric forms
+        self.assertFalse(examples.canonical.any())
+        self.assertEqual(examples.countForms(8), len(examples))
+
+
+class TestAugment(unittest.TestCase):
+
+    def forms(self, game, board, pi):
+        """
+        Returns the (board, pi) forms of getSymmetries as bytes, so they can be compared.
+        """
+        return [(np.ascontiguousarray(b, dtype=np.int8).tobytes(), np.asarray(p, dtype=np.float32).tobytes())
+                for b, p in game.getSymmetries(board, pi)]
+
+    def augmentCopies(self, game, board, pi, copies=256, mask=None):
+        nnet = NNetWrapper(game, NET_ARGS)
+        boards = torch.from_numpy(np.repeat(board[None], copies, axis=0))
+        pis = torch.from_numpy(np.repeat(pi[None], copies, axis=0))
+        torch.manual_seed(0)
+        boards, pis = nnet.augment(boards.to(nnet.symmetries.device), pis.to(nnet.symmetries.device), mask)
+        return [(b.cpu().numpy().tobytes(), p.cpu().numpy().tobytes()) for b, p in zip(boards, pis)]
+
+    def test_every_permutation_is_a_symmetry(self):
+        for featurePlanes in (False, True):
+            game = GomakuGame(8, featurePlanes=featurePlanes)
+            rng = np.random.RandomState(0)
+            board = rng.choice([-1, 0, 1], size=(8, 8)).astype(np.int8)
+            if featurePlanes:
+                board = game.getFeaturePlanes(board, int(np.flatnonzero(board.ravel() == -1)[0]))
+            pi = rng.dirichlet(np.ones(64)).astype(np.float32)
+            forms = self.forms(game, board, pi)
+            self.assertEqual(len(set(forms)), 8)  # the board has no symmetry of its own
+            augmented = self.augmentCopies(game, board, pi)
+            # board and policy are transformed by the same symmetry, and every symmetry is used
+            self.assertTrue(set(augmented) <= set(forms))
+            self.assertEqual(set(augmented), set(forms))
+
+    def test_mask(self):
+        game = GomakuGame(8)
+        rng = np.random.RandomState(1)
+        board = rng.choice([-1, 0, 1], size=(8, 8)).astype(np.int8)
+        pi = rng.dirichlet(np.ones(64)).astype(np.float32)
+        mask = np.arange(256) % 3 == 0
+        augmented = self.augmentCopies(game, board, pi, mask=mask)
+        original = (board.tobytes(), pi.tobytes())
+        self.assertTrue(all(form == original for form, keep in zip(augmented, mask) if not keep))
+        self.assertGreater(len(set(form for form, keep in zip(augmented, mask) if keep)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()